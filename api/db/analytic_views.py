@@ -0,0 +1,165 @@
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from typing import Dict, List, Set
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+class AnalyticView:
+    """A read-only daily aggregate for the chat agent.
+
+    The rows live in the materialized view {name}_mv, refreshed with the
+    rollups whenever one of its source watermarks moved; the agent reads
+    them through the plain view {name}, which is what SQLDatabase lists (it
+    does not reflect materialized views).
+    """
+
+    def __init__(self, name: str, description: str, key: List[str], query: str, sources: List[str]):
+        self.name = name
+        self.description = description
+        self.key = key
+        self.query = query
+        self.sources = sources
+
+    @property
+    def storage(self) -> str:
+        return f"{self.name}_mv"
+
+    @property
+    def definition(self) -> str:
+        """Hash of the query, stored as the materialized view's comment"""
+        return hashlib.md5(self.query.encode()).hexdigest()
+
+ANALYTIC_VIEWS: Dict[str, AnalyticView] = {view.name: view for view in [
+    AnalyticView(
+        "brand_daily_sales",
+        "sales per brand per day: revenue (rupiah, each order split across its brands and subcategories as on the sales dashboard), transactions, units_sold, avg_return_rate",
+        ["day", "brand"],
+        """
+            WITH brand_days AS (
+                SELECT
+                    day,
+                    brand,
+                    SUM(order_value) AS revenue,
+                    SUM(units) AS units_sold,
+                    SUM(return_rate_sum) / NULLIF(SUM(return_rate_count), 0) AS avg_return_rate
+                FROM sales_daily_rollup
+                WHERE brand IS NOT NULL
+                GROUP BY day, brand
+            ),
+            brand_transactions AS (
+                SELECT day, brand, COUNT(DISTINCT transaction_id) AS transactions
+                FROM sales_daily_rollup, UNNEST(transaction_ids) AS transaction_id
+                WHERE brand IS NOT NULL
+                GROUP BY day, brand
+            )
+            SELECT
+                b.day,
+                b.brand,
+                COALESCE(b.revenue, 0) AS revenue,
+                COALESCE(t.transactions, 0) AS transactions,
+                b.units_sold,
+                b.avg_return_rate
+            FROM brand_days b
+            LEFT JOIN brand_transactions t ON t.day = b.day AND t.brand = b.brand
+        """,
+        ["sales_daily_rollup"]
+    ),
+    AnalyticView(
+        "product_daily_sales",
+        "units sold and transactions per product per day, with product_name, brand and subcategory",
+        ["day", "product_id"],
+        """
+            SELECT
+                s.purchase_date AS day,
+                pc.product_id,
+                pc.product_name,
+                pc.brand,
+                pc.subcategory,
+                COUNT(*) AS units_sold,
+                COUNT(DISTINCT s.transaction_id) AS transactions
+            FROM sale_product sp
+            JOIN sales s ON s.transaction_id = sp.transaction_id
+            JOIN product_catalog pc ON pc.product_id = sp.product_id
+            WHERE s.purchase_date IS NOT NULL
+            GROUP BY s.purchase_date, pc.product_id, pc.product_name, pc.brand, pc.subcategory
+        """,
+        ["sales_daily_rollup"]
+    ),
+    AnalyticView(
+        "brand_daily_reviews",
+        "product reviews per brand per day: reviews, positive_reviews (sentiment_score >= 0.5), avg_sentiment, avg_rating",
+        ["day", "brand"],
+        """
+            SELECT
+                review_date AS day,
+                brand,
+                COUNT(*) AS reviews,
+                COUNT(*) FILTER (WHERE sentiment_score >= 0.5) AS positive_reviews,
+                AVG(sentiment_score) AS avg_sentiment,
+                AVG(rating) AS avg_rating
+            FROM reviewed_product
+            WHERE review_date IS NOT NULL AND brand IS NOT NULL
+            GROUP BY review_date, brand
+        """,
+        ["reviewed_product"]
+    ),
+    AnalyticView(
+        "platform_daily_social",
+        "social media activity per brand and platform per day: posts, reach, engagement, comments, avg_comment_sentiment",
+        ["day", "brand", "platform"],
+        """
+            SELECT
+                sm.post_date AS day,
+                sm.brand,
+                sm.platform,
+                COUNT(*) AS posts,
+                COALESCE(SUM(sm.reach_count), 0) AS reach,
+                COALESCE(SUM(sm.engagement_count), 0) AS engagement,
+                COUNT(ssm.id_post) AS comments,
+                AVG(ssm.sentiment_score) AS avg_comment_sentiment
+            FROM social_media sm
+            LEFT JOIN sentiment_social_media ssm ON ssm.id_post = sm.social_media_post_id
+            WHERE sm.post_date IS NOT NULL AND sm.brand IS NOT NULL AND sm.platform IS NOT NULL
+            GROUP BY sm.post_date, sm.brand, sm.platform
+        """,
+        ["collaborator_daily_stats"]
+    )
+]}
+
+def ensure_analytic_views(engine):
+    """Create missing analytic views and recreate those whose query changed; the rest keep their rows"""
+    for view in ANALYTIC_VIEWS.values():
+        try:
+            with engine.begin() as connection:
+                current = connection.execute(
+                    text("SELECT obj_description(to_regclass(:name), 'pg_class')"), {"name": view.storage}
+                ).scalar()
+                if current != view.definition:
+                    connection.execute(text(f"DROP VIEW IF EXISTS {view.name}"))
+                    connection.execute(text(f"DROP MATERIALIZED VIEW IF EXISTS {view.storage}"))
+                connection.execute(text(f"CREATE MATERIALIZED VIEW IF NOT EXISTS {view.storage} AS {view.query}"))
+                connection.execute(text(f"COMMENT ON MATERIALIZED VIEW {view.storage} IS '{view.definition}'"))
+                # REFRESH ... CONCURRENTLY needs a unique index and keeps the view readable meanwhile
+                connection.execute(text(
+                    f"CREATE UNIQUE INDEX IF NOT EXISTS {view.storage}_key ON {view.storage} ({', '.join(view.key)})"
+                ))
+                connection.execute(text(f"CREATE OR REPLACE VIEW {view.name} AS SELECT * FROM {view.storage}"))
+        except Exception as e:
+            logger.error(f"Failed to create analytic view {view.name}: {str(e)}")
+
+def refresh_analytic_views(db: Session, moved: Set[str]):
+    """Recompute the analytic views reading from a source whose watermark moved.
+
+    Each view refreshes in its own savepoint, so a failing one does not
+    roll back the rollups refreshed in the same transaction.
+    """
+    for view in ANALYTIC_VIEWS.values():
+        if not moved & set(view.sources):
+            continue
+        try:
+            with db.begin_nested():
+                db.execute(text(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {view.storage}"))
+        except Exception as e:
+            logger.error(f"Failed to refresh analytic view {view.name}: {str(e)}")
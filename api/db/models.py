@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, Date, Boolean, ForeignKey, ARRAY, JSON, DECIMAL, Text
+from sqlalchemy import Column, Integer, String, Float, Date, Boolean, ForeignKey, ARRAY, JSON, DECIMAL, Text, Index, BigInteger
 from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship
 from db.database import Base
@@ -107,6 +107,11 @@ class SocialMedia(Base):
     jenis_konten = Column(String(100))
     sentiment = relationship("SentimentSocialMedia", back_populates="post", uselist=False)
 
+    __table_args__ = (
+        # Supports the brand/date filtered top-posts ranking; built by `python -m db.schema`
+        Index("ix_social_media_brand_post_date_reach", "brand", "post_date", "reach_count", postgresql_concurrently=True),
+    )
+
 class SentimentSocialMedia(Base):
     __tablename__ = "sentiment_social_media"
     
@@ -149,3 +154,53 @@ class SustainabilityIntegration(Base):
     column_name = Column(String(255), primary_key=True)
     eco_friendly_keyword_usage = Column(ARRAY(String))
     sustainability_sentiment_score = Column(DECIMAL)
+
+class CollaboratorDailyStats(Base):
+    __tablename__ = "collaborator_daily_stats"
+    
+    brand = Column(String(100), primary_key=True)
+    collabs = Column(String(255), primary_key=True)
+    day = Column(Date, primary_key=True)
+    reach = Column(BigInteger, nullable=False, default=0)
+    engagement = Column(BigInteger, nullable=False, default=0)
+    posts = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        Index("ix_collaborator_daily_stats_day", "day"),
+    )
+
+class SalesDailyRollup(Base):
+    __tablename__ = "sales_daily_rollup"
+    
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    day = Column(Date, nullable=False)
+    brand = Column(String(100))
+    subcategory = Column(String(100))
+    location = Column(String(255))
+    # Order value is split evenly across the (brand, subcategory) groups of a transaction
+    order_value = Column(Float, nullable=False, default=0)
+    transactions = Column(Integer, nullable=False, default=0)
+    units = Column(Integer, nullable=False, default=0)
+    customers = Column(Integer, nullable=False, default=0)
+    customer_ids = Column(ARRAY(Integer))
+    # Distinct transactions per subcategory, since one transaction can span several brand rows
+    transaction_ids = Column(ARRAY(Integer))
+    return_rate_sum = Column(Float, nullable=False, default=0)
+    return_rate_count = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        Index("ix_sales_daily_rollup_day_brand", "day", "brand"),
+    )
+
+class RollupWatermark(Base):
+    __tablename__ = "rollup_watermark"
+    
+    name = Column(String(100), primary_key=True)
+    value = Column(BigInteger, nullable=False)
+
+class RollupDirtyDay(Base):
+    """Days whose source rows changed, queued by triggers on the ingest tables for the next refresh"""
+    __tablename__ = "rollup_dirty_day"
+    
+    name = Column(String(100), primary_key=True)
+    day = Column(Date, primary_key=True)
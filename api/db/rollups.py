@@ -0,0 +1,261 @@
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from datetime import date, timedelta
+from typing import Iterable
+from db.database import Base, get_db_session
+from db.models import RollupWatermark
+from db.schema import ROLLUP_TABLES
+from db.sales_snapshot import SALES_SNAPSHOT_CHANNEL
+from db.analytic_views import refresh_analytic_views
+import hashlib
+import os
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Days behind today that are always recomputed, so late engagement updates are picked up
+ROLLUP_LOOKBACK_DAYS = int(os.getenv("ROLLUP_LOOKBACK_DAYS", "3"))
+
+# Advisory lock key so only one worker refreshes the rollups at a time
+ROLLUP_LOCK_KEY = 720027
+
+# How long a worker trusts its last read of the data version
+DATA_VERSION_CHECK_INTERVAL = int(os.getenv("DATA_VERSION_CHECK_INTERVAL", "60"))
+
+_data_version = None
+_data_version_checked_at = 0.0
+
+def get_watermark(db: Session, name: str):
+    watermark = db.get(RollupWatermark, name)
+    return watermark.value if watermark else None
+
+def set_watermark(db: Session, name: str, value: int):
+    watermark = db.get(RollupWatermark, name)
+    if watermark:
+        watermark.value = value
+    else:
+        db.add(RollupWatermark(name=name, value=value))
+
+# Tables the API reads and does not write itself; writes to the rollups and chat history do not count
+SOURCE_TABLES = sorted(table.name for table in Base.metadata.sorted_tables if table not in ROLLUP_TABLES)
+
+def get_data_version() -> str:
+    """Tag that changes whenever a source table is written or the rollups pick up new rows.
+
+    Cached results computed under another tag are stale. Writes are seen
+    through Postgres' cumulative row counters (inserted, updated and
+    deleted tuples per table), so updates to existing rows and changes to
+    tables without a watermark count too. Backends publish their counters
+    up to about ten seconds after commit. A rolled back write or a
+    statistics reset also changes the tag, which only costs a cache miss.
+    """
+    global _data_version, _data_version_checked_at
+    if _data_version is None or time.time() - _data_version_checked_at >= DATA_VERSION_CHECK_INTERVAL:
+        db = get_db_session()
+        try:
+            rows = db.query(RollupWatermark.name, RollupWatermark.value).order_by(RollupWatermark.name).all()
+            writes = db.execute(text("""
+                SELECT relname, n_tup_ins, n_tup_upd, n_tup_del
+                FROM pg_stat_user_tables
+                WHERE schemaname = 'public' AND relname = ANY(:tables)
+                ORDER BY relname
+            """), {"tables": SOURCE_TABLES}).all()
+            _data_version = hashlib.md5(repr([tuple(row) for row in rows + writes]).encode()).hexdigest()
+            _data_version_checked_at = time.time()
+        finally:
+            db.close()
+    return _data_version
+
+def refresh_collaborator_stats(db: Session, days: Iterable[date]):
+    """Recompute collaborator_daily_stats for the given days.
+
+    Called by the scheduled refresh, and usable by an ingest job with the
+    post dates it touched. Recomputing whole days keeps the refresh idempotent.
+    """
+    days = sorted(set(days))
+    if not days:
+        return
+    db.execute(
+        text("DELETE FROM collaborator_daily_stats WHERE day = ANY(:days)"),
+        {"days": days}
+    )
+    db.execute(
+        text("""
+            INSERT INTO collaborator_daily_stats (brand, collabs, day, reach, engagement, posts)
+            SELECT
+                COALESCE(sm.brand, ''),
+                sm.collabs,
+                sm.post_date,
+                SUM(COALESCE(sm.reach_count, 0)),
+                SUM(COALESCE(ssm.total_likes, 0) + COALESCE(ssm.total_replies, 0)),
+                COUNT(*)
+            FROM social_media sm
+            LEFT JOIN sentiment_social_media ssm ON ssm.id_post = sm.social_media_post_id
+            WHERE sm.collabs IS NOT NULL
+              AND sm.post_date = ANY(:days)
+            GROUP BY COALESCE(sm.brand, ''), sm.collabs, sm.post_date
+        """),
+        {"days": days}
+    )
+
+def refresh_collaborator_stats_incremental(db: Session) -> bool:
+    """Refresh the days of posts ingested since the last run, the days queued by the
+    change triggers (see db.schema) and the lookback window.
+
+    Without the triggers, changes to posts older than the lookback window
+    are only picked up by a full rebuild. Returns True when new posts or
+    changed days were found.
+    """
+    watermark = get_watermark(db, "collaborator_daily_stats")
+    max_post_id = db.execute(text("SELECT MAX(social_media_post_id) FROM social_media")).scalar()
+    if max_post_id is None:
+        return False
+
+    if watermark is None:
+        # First run: build the whole table
+        days = [row.post_date for row in db.execute(text(
+            "SELECT DISTINCT post_date FROM social_media WHERE post_date IS NOT NULL"
+        ))]
+    else:
+        days = [row.post_date for row in db.execute(
+            text("""
+                SELECT DISTINCT post_date FROM social_media
+                WHERE social_media_post_id > :watermark AND post_date IS NOT NULL
+            """),
+            {"watermark": watermark}
+        )]
+        today = date.today()
+        days += [today - timedelta(days=offset) for offset in range(ROLLUP_LOOKBACK_DAYS + 1)]
+
+    # Taken in this transaction, so a failed refresh leaves them queued
+    changed = [row.day for row in db.execute(text(
+        "DELETE FROM rollup_dirty_day WHERE name = 'collaborator_daily_stats' RETURNING day"
+    ))]
+    refresh_collaborator_stats(db, days + changed)
+    set_watermark(db, "collaborator_daily_stats", max_post_id)
+    return watermark != max_post_id or bool(changed)
+
+def refresh_sales_rollup(db: Session, days: Iterable[date]):
+    """Recompute sales_daily_rollup for the given days.
+
+    Each transaction contributes one row per (brand, subcategory) it touches,
+    so multi-item orders are not counted once per product, and its order value
+    is split across those rows so totals add up to the real order value.
+    """
+    days = sorted(set(days))
+    if not days:
+        return
+    db.execute(
+        text("DELETE FROM sales_daily_rollup WHERE day = ANY(:days)"),
+        {"days": days}
+    )
+    db.execute(
+        text("""
+            WITH lines AS (
+                SELECT
+                    s.transaction_id,
+                    s.purchase_date AS day,
+                    pc.brand,
+                    pc.subcategory,
+                    cd.location,
+                    s.order_value,
+                    s.return_rate,
+                    s.customer_id,
+                    COUNT(*) AS units
+                FROM sales s
+                JOIN sale_product sp ON sp.transaction_id = s.transaction_id
+                JOIN product_catalog pc ON pc.product_id = sp.product_id
+                LEFT JOIN customer_demographics cd ON cd.customer_id = s.customer_id
+                WHERE s.purchase_date = ANY(:days)
+                GROUP BY s.transaction_id, s.purchase_date, pc.brand, pc.subcategory, cd.location,
+                         s.order_value, s.return_rate, s.customer_id
+            ),
+            allocated AS (
+                SELECT *, COUNT(*) OVER (PARTITION BY transaction_id) AS line_count
+                FROM lines
+            )
+            INSERT INTO sales_daily_rollup (
+                day, brand, subcategory, location, order_value, transactions, units,
+                customers, customer_ids, transaction_ids, return_rate_sum, return_rate_count
+            )
+            SELECT
+                day,
+                brand,
+                subcategory,
+                location,
+                COALESCE(SUM(order_value / line_count), 0),
+                COUNT(*),
+                SUM(units),
+                COUNT(DISTINCT customer_id),
+                ARRAY_AGG(DISTINCT customer_id) FILTER (WHERE customer_id IS NOT NULL),
+                ARRAY_AGG(DISTINCT transaction_id),
+                COALESCE(SUM(return_rate), 0),
+                COUNT(return_rate)
+            FROM allocated
+            GROUP BY day, brand, subcategory, location
+        """),
+        {"days": days}
+    )
+
+def refresh_sales_rollup_incremental(db: Session) -> bool:
+    """Refresh the days of transactions ingested since the last run plus the lookback window.
+
+    Returns True when new transactions were found.
+    """
+    watermark = get_watermark(db, "sales_daily_rollup")
+    max_transaction_id = db.execute(text("SELECT MAX(transaction_id) FROM sales")).scalar()
+    if max_transaction_id is None:
+        return False
+
+    if watermark is None:
+        days = [row.purchase_date for row in db.execute(text(
+            "SELECT DISTINCT purchase_date FROM sales WHERE purchase_date IS NOT NULL"
+        ))]
+    else:
+        days = [row.purchase_date for row in db.execute(
+            text("""
+                SELECT DISTINCT purchase_date FROM sales
+                WHERE transaction_id > :watermark AND purchase_date IS NOT NULL
+            """),
+            {"watermark": watermark}
+        )]
+        today = date.today()
+        days += [today - timedelta(days=offset) for offset in range(ROLLUP_LOOKBACK_DAYS + 1)]
+
+    refresh_sales_rollup(db, days)
+    set_watermark(db, "sales_daily_rollup", max_transaction_id)
+    return watermark != max_transaction_id
+
+def advance_review_watermark(db: Session) -> bool:
+    """Move the reviewed_product watermark to the latest review, returns True when it moved"""
+    watermark = get_watermark(db, "reviewed_product")
+    max_review_id = db.execute(text("SELECT MAX(customer_review_id) FROM reviewed_product")).scalar()
+    if max_review_id is None:
+        return False
+    set_watermark(db, "reviewed_product", max_review_id)
+    return watermark != max_review_id
+
+def refresh_rollups():
+    """Scheduled job: incrementally refresh every rollup table, then the analytic views whose watermark moved"""
+    db = get_db_session()
+    try:
+        locked = db.execute(text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": ROLLUP_LOCK_KEY}).scalar()
+        if not locked:
+            return
+        moved = set()
+        if refresh_collaborator_stats_incremental(db):
+            moved.add("collaborator_daily_stats")
+        if refresh_sales_rollup_incremental(db):
+            moved.add("sales_daily_rollup")
+            # Delivered on commit; in-memory sales snapshots reload on it
+            db.execute(text("SELECT pg_notify(:channel, '')"), {"channel": SALES_SNAPSHOT_CHANNEL})
+        if advance_review_watermark(db):
+            moved.add("reviewed_product")
+        refresh_analytic_views(db, moved)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Error refreshing rollups: {str(e)}")
+    finally:
+        db.close()
@@ -0,0 +1,224 @@
+from sqlalchemy import text
+from datetime import date, datetime
+from typing import Dict, List, Any, Optional
+from db.database import engine, DATABASE_URL
+import numpy as np
+import psycopg2
+import threading
+import select
+import os
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# The snapshot is optional; without it the sales endpoints query Postgres
+SALES_SNAPSHOT_ENABLED = os.getenv("SALES_SNAPSHOT_ENABLED", "false").lower() == "true"
+SALES_SNAPSHOT_REFRESH_MINUTES = int(os.getenv("SALES_SNAPSHOT_REFRESH_MINUTES", "15"))
+SALES_SNAPSHOT_CHANNEL = os.getenv("SALES_SNAPSHOT_CHANNEL", "sales_changed")
+
+# Same grain as sales_daily_rollup: one row per transaction and (brand, subcategory)
+SNAPSHOT_QUERY = """
+    WITH lines AS (
+        SELECT DISTINCT
+            s.transaction_id,
+            s.purchase_date AS day,
+            pc.brand,
+            pc.subcategory,
+            cd.location,
+            cd.gender,
+            cd.age_group,
+            s.order_value,
+            s.return_rate,
+            s.customer_id
+        FROM sales s
+        JOIN sale_product sp ON sp.transaction_id = s.transaction_id
+        JOIN product_catalog pc ON pc.product_id = sp.product_id
+        LEFT JOIN customer_demographics cd ON cd.customer_id = s.customer_id
+        WHERE s.purchase_date IS NOT NULL
+    )
+    SELECT
+        transaction_id, day, brand, subcategory, location, gender, age_group,
+        order_value / COUNT(*) OVER (PARTITION BY transaction_id) AS order_value,
+        return_rate,
+        customer_id
+    FROM lines
+"""
+
+ENCODED_COLUMNS = ("brand", "subcategory", "location", "gender", "age_group")
+
+def encode(values: List[Any]):
+    """Dictionary-encode a column into int32 codes and the list of distinct values"""
+    index = {}
+    codes = np.fromiter((index.setdefault(v, len(index)) for v in values), dtype=np.int32, count=len(values))
+    return codes, list(index)
+
+def to_ordinal(value) -> int:
+    if isinstance(value, str):
+        value = datetime.strptime(value, "%Y-%m-%d").date()
+    return value.toordinal()
+
+class SalesSnapshot:
+    """Columnar copy of the sales fact answering the /api/sales widgets in memory"""
+
+    def __init__(self, rows: List[Any]):
+        columns = list(zip(*rows)) if rows else [()] * 10
+        (transaction_id, day, brand, subcategory, location,
+         gender, age_group, order_value, return_rate, customer_id) = columns
+
+        self.size = len(rows)
+        self.transaction_id = np.array(transaction_id, dtype=np.int64)
+        self.day = np.fromiter((d.toordinal() for d in day), dtype=np.int32, count=self.size)
+        self.order_value = np.array([v or 0.0 for v in order_value], dtype=np.float64)
+        self.return_rate = np.array([np.nan if v is None else v for v in return_rate], dtype=np.float64)
+        self.customer_id = np.array([-1 if v is None else v for v in customer_id], dtype=np.int64)
+
+        self.codes = {}
+        self.dictionaries = {}
+        for name, values in zip(ENCODED_COLUMNS, (brand, subcategory, location, gender, age_group)):
+            self.codes[name], self.dictionaries[name] = encode(values)
+        self.loaded_at = time.time()
+
+    @classmethod
+    def load(cls):
+        with engine.connect() as conn:
+            rows = conn.execute(text(SNAPSHOT_QUERY)).all()
+        return cls(rows)
+
+    def mask(self, brand: str = None, startDate=None, endDate=None) -> np.ndarray:
+        mask = np.ones(self.size, dtype=bool)
+        if brand:
+            dictionary = self.dictionaries["brand"]
+            if brand not in dictionary:
+                return np.zeros(self.size, dtype=bool)
+            mask &= self.codes["brand"] == dictionary.index(brand)
+        if startDate and endDate:
+            mask &= (self.day >= to_ordinal(startDate)) & (self.day <= to_ordinal(endDate))
+        return mask
+
+    def group_sum(self, column: str, mask: np.ndarray, weights: np.ndarray = None) -> np.ndarray:
+        return np.bincount(
+            self.codes[column][mask],
+            weights=None if weights is None else weights[mask],
+            minlength=len(self.dictionaries[column])
+        )
+
+    def distinct_customers(self, mask: np.ndarray) -> np.ndarray:
+        """Row positions of the first occurrence of each customer within the mask"""
+        positions = np.flatnonzero(mask & (self.customer_id >= 0))
+        _, first = np.unique(self.customer_id[positions], return_index=True)
+        return positions[first]
+
+    def daily_sales(self, brand: str = None, startDate=None, endDate=None) -> List[Dict[str, Any]]:
+        mask = self.mask(brand, startDate, endDate)
+        if not mask.any():
+            return []
+        days = self.day[mask]
+        offset = days.min()
+        values = np.bincount(days - offset, weights=self.order_value[mask])
+        present = np.flatnonzero(np.bincount(days - offset))
+        result = []
+        for position in present:
+            day = date.fromordinal(int(position + offset))
+            result.append({"day": day.strftime("%Y-%m-%d"), "weekday": day.strftime("%a"), "orderValue": float(values[position])})
+        return result
+
+    def product_categories(self, brand: str = None, startDate=None, endDate=None) -> List[Dict[str, Any]]:
+        # Rows are per (brand, subcategory), count each transaction once per subcategory
+        positions = np.flatnonzero(self.mask(brand, startDate, endDate))
+        pairs = np.unique(np.stack([self.transaction_id[positions], self.codes["subcategory"][positions]]), axis=1)
+        volumes = np.bincount(pairs[1], minlength=len(self.dictionaries["subcategory"]))
+        order = np.argsort(-volumes, kind="stable")
+        return [
+            {"category": self.dictionaries["subcategory"][code], "volume": int(volumes[code])}
+            for code in order if volumes[code] > 0
+        ]
+
+    def return_rates(self, brand: str = None, startDate=None, endDate=None) -> List[Dict[str, Any]]:
+        mask = self.mask(brand, startDate, endDate)
+        rated = mask & ~np.isnan(self.return_rate)
+        totals = self.group_sum("subcategory", rated, np.nan_to_num(self.return_rate))
+        counts = self.group_sum("subcategory", rated)
+        present = self.group_sum("subcategory", mask)
+        return [
+            {"category": self.dictionaries["subcategory"][code], "value": float(totals[code] * 100.0 / counts[code]) if counts[code] else 0.0}
+            for code in np.flatnonzero(present)
+        ]
+
+    def customer_locations(self, brand: str = None, startDate=None, endDate=None) -> List[Dict[str, Any]]:
+        customers = self.distinct_customers(self.mask(brand, startDate, endDate))
+        counts = np.bincount(self.codes["location"][customers], minlength=len(self.dictionaries["location"]))
+        order = np.argsort(-counts, kind="stable")[:10]
+        return [
+            {"city": self.dictionaries["location"][code], "customers": int(counts[code])}
+            for code in order if counts[code] > 0
+        ]
+
+    def demographics(self, dims: List[str], brand: str = None, startDate=None, endDate=None) -> Dict[str, Any]:
+        """Distribution of distinct customers over each dimension, keyed like /demographics"""
+        customers = self.distinct_customers(self.mask(brand, startDate, endDate))
+        total = len(customers)
+        result = {"total": total}
+        for dim in dims:
+            counts = np.bincount(self.codes[dim][customers], minlength=len(self.dictionaries[dim]))
+            result[dim] = [
+                (self.dictionaries[dim][code], float(counts[code] * 100.0 / total))
+                for code in np.flatnonzero(counts)
+            ]
+        return result
+
+_snapshot: Optional[SalesSnapshot] = None
+_refresh_lock = threading.Lock()
+
+def get_sales_snapshot() -> Optional[SalesSnapshot]:
+    """Current snapshot, or None when disabled or not loaded yet"""
+    return _snapshot if SALES_SNAPSHOT_ENABLED else None
+
+def refresh_sales_snapshot():
+    """Rebuild the snapshot and swap it in; readers keep using the previous one meanwhile"""
+    global _snapshot
+    if not _refresh_lock.acquire(blocking=False):
+        return
+    try:
+        started = time.time()
+        _snapshot = SalesSnapshot.load()
+        logger.info(f"Sales snapshot loaded: {_snapshot.size:,} rows in {time.time() - started:.2f}s")
+    except Exception as e:
+        logger.error(f"Error refreshing sales snapshot: {str(e)}")
+    finally:
+        _refresh_lock.release()
+
+def listen_for_changes(stop_event: threading.Event):
+    """Refresh the snapshot whenever something runs NOTIFY on the sales channel"""
+    while not stop_event.is_set():
+        conn = None
+        try:
+            # Dedicated connection so LISTEN never ends up on a pooled one
+            conn = psycopg2.connect(DATABASE_URL)
+            conn.autocommit = True
+            conn.cursor().execute(f"LISTEN {SALES_SNAPSHOT_CHANNEL}")
+            while not stop_event.is_set():
+                if select.select([conn], [], [], 5) == ([], [], []):
+                    continue
+                conn.poll()
+                if conn.notifies:
+                    conn.notifies.clear()
+                    refresh_sales_snapshot()
+        except Exception as e:
+            logger.error(f"Sales snapshot listener error: {str(e)}")
+            stop_event.wait(5)
+        finally:
+            if conn is not None:
+                conn.close()
+
+def start_sales_snapshot(scheduler) -> Optional[threading.Event]:
+    """Load the snapshot in the background, schedule refreshes and start the NOTIFY listener"""
+    if not SALES_SNAPSHOT_ENABLED:
+        return None
+    scheduler.add_job(
+        refresh_sales_snapshot, "interval", minutes=SALES_SNAPSHOT_REFRESH_MINUTES,
+        id="refresh_sales_snapshot", next_run_time=datetime.now()
+    )
+    stop_event = threading.Event()
+    threading.Thread(target=listen_for_changes, args=(stop_event,), daemon=True, name="sales-snapshot-listener").start()
+    return stop_event
@@ -0,0 +1,113 @@
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateIndex
+from db.database import Base, engine
+from db.analytic_views import ensure_analytic_views
+from db.models import CollaboratorDailyStats, SalesDailyRollup, RollupWatermark, RollupDirtyDay, SocialMedia
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Tables owned by the API; every other model maps a table loaded by the ingest pipeline
+ROLLUP_TABLES = [
+    CollaboratorDailyStats.__table__, SalesDailyRollup.__table__, RollupWatermark.__table__, RollupDirtyDay.__table__
+]
+
+# Indexes the API adds to ingest tables. Building them locks writes on large tables, so
+# they are not created at startup but by `python -m db.schema`, concurrently, once per deploy
+INGEST_INDEXES = [index for index in SocialMedia.__table__.indexes if index.name == "ix_social_media_brand_post_date_reach"]
+
+# Queue the post days touched by any write to the social tables, so engagement updated on
+# old posts reaches collaborator_daily_stats; installed with the ingest indexes
+COLLABORATOR_DAY_TRIGGERS = {
+    "social_media": """
+        IF TG_OP <> 'INSERT' AND OLD.post_date IS NOT NULL THEN
+            INSERT INTO rollup_dirty_day (name, day) VALUES ('collaborator_daily_stats', OLD.post_date)
+            ON CONFLICT DO NOTHING;
+        END IF;
+        IF TG_OP <> 'DELETE' AND NEW.post_date IS NOT NULL THEN
+            INSERT INTO rollup_dirty_day (name, day) VALUES ('collaborator_daily_stats', NEW.post_date)
+            ON CONFLICT DO NOTHING;
+        END IF;
+    """,
+    "sentiment_social_media": """
+        INSERT INTO rollup_dirty_day (name, day)
+        SELECT 'collaborator_daily_stats', post_date FROM social_media
+        WHERE social_media_post_id IN (
+            CASE WHEN TG_OP <> 'INSERT' THEN OLD.id_post END,
+            CASE WHEN TG_OP <> 'DELETE' THEN NEW.id_post END
+        ) AND post_date IS NOT NULL
+        ON CONFLICT DO NOTHING;
+    """
+}
+
+# Columns added to rollup tables after their first release; the rollup is recomputed to fill them
+ADDED_ROLLUP_COLUMNS = {
+    "transaction_ids": "INTEGER[]",
+    "units": "INTEGER NOT NULL DEFAULT 0"
+}
+
+# Advisory lock key so the workers starting together run the DDL one at a time
+SCHEMA_LOCK_KEY = 720028
+
+def add_missing_rollup_columns(connection):
+    """Add columns introduced after a rollup table was created, and recompute the rollup to fill them"""
+    columns = {column["name"] for column in inspect(connection).get_columns("sales_daily_rollup")}
+    missing = [name for name in ADDED_ROLLUP_COLUMNS if name not in columns]
+    for name in missing:
+        connection.execute(text(f"ALTER TABLE sales_daily_rollup ADD COLUMN IF NOT EXISTS {name} {ADDED_ROLLUP_COLUMNS[name]}"))
+    if missing:
+        # Without a watermark the next refresh recomputes every day
+        connection.execute(text("DELETE FROM rollup_watermark WHERE name = 'sales_daily_rollup'"))
+
+def ensure_schema():
+    """Create missing rollup tables, their indexes and the analytic views"""
+    # Autocommit, so a failing index does not abort the statements after it
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        connection.execute(text("SELECT pg_advisory_lock(:key)"), {"key": SCHEMA_LOCK_KEY})
+        try:
+            Base.metadata.create_all(bind=connection, tables=ROLLUP_TABLES, checkfirst=True)
+            add_missing_rollup_columns(connection)
+            # Indexes added to a rollup table after it was created
+            for table in ROLLUP_TABLES:
+                for index in table.indexes:
+                    try:
+                        index.create(bind=connection, checkfirst=True)
+                    except Exception as e:
+                        logger.error(f"Failed to create index {index.name}: {str(e)}")
+            ensure_analytic_views(engine)
+        finally:
+            connection.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": SCHEMA_LOCK_KEY})
+
+def create_collaborator_day_triggers():
+    """Install the triggers queueing changed post days, replacing older versions"""
+    RollupDirtyDay.__table__.create(bind=engine, checkfirst=True)
+    for table, body in COLLABORATOR_DAY_TRIGGERS.items():
+        with engine.begin() as connection:
+            connection.execute(text(
+                f"CREATE OR REPLACE FUNCTION {table}_mark_collaborator_days() RETURNS trigger AS $$ "
+                f"BEGIN {body} RETURN NULL; END $$ LANGUAGE plpgsql"
+            ))
+            connection.execute(text(f"DROP TRIGGER IF EXISTS {table}_collaborator_days ON {table}"))
+            connection.execute(text(
+                f"CREATE TRIGGER {table}_collaborator_days AFTER INSERT OR UPDATE OR DELETE ON {table} "
+                f"FOR EACH ROW EXECUTE FUNCTION {table}_mark_collaborator_days()"
+            ))
+        print(f"Installed trigger {table}_collaborator_days")
+
+def create_ingest_indexes():
+    """Build INGEST_INDEXES with CREATE INDEX CONCURRENTLY, replacing any left invalid by a failed build"""
+    # CONCURRENTLY cannot run inside a transaction
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        for index in INGEST_INDEXES:
+            invalid = connection.execute(text("""
+                SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+                WHERE c.relname = :name AND NOT i.indisvalid
+            """), {"name": index.name}).scalar()
+            if invalid:
+                connection.execute(text(f"DROP INDEX CONCURRENTLY {index.name}"))
+            print(f"Creating index {index.name}")
+            connection.execute(CreateIndex(index, if_not_exists=True))
+
+if __name__ == "__main__":
+    create_ingest_indexes()
+    create_collaborator_day_triggers()
@@ -12,6 +12,14 @@ from routes_sales import router as sales_router
 from routes_ai_chatbot import router as ai_router
 import logging
 from tools.faiss_vectordb import load_vector_db
+from tools.langchain_rag import get_shared_agent, refresh_shared_agent, SCHEMA_CHECK_INTERVAL
+from tools.checkpointer import open_checkpointer, close_checkpointer
+from db.schema import ensure_schema
+from db.rollups import refresh_rollups
+from db.sales_snapshot import start_sales_snapshot
+from apscheduler.schedulers.background import BackgroundScheduler
+import os
+from datetime import datetime
 
 # Set up logging
 logging.basicConfig(
@@ -65,6 +73,42 @@ app.include_router(ai_router)
 # Make vector_store available to routes
 app.state.vector_store = vector_store
 
+# Background jobs keeping the rollup tables up to date
+ROLLUP_REFRESH_MINUTES = int(os.getenv("ROLLUP_REFRESH_MINUTES", "5"))
+scheduler = BackgroundScheduler()
+
+@app.on_event("startup")
+async def on_startup():
+    try:
+        ensure_schema()
+    except Exception as e:
+        logger.error(f"Failed to ensure database schema: {str(e)}")
+
+    # Open the durable chat history store before the shared agent is built on it
+    try:
+        await open_checkpointer()
+    except Exception as e:
+        logger.error(f"Failed to open chat checkpointer, using in-memory history: {str(e)}")
+
+    # Build the shared chat agent up front so the first chat message does not pay for it
+    try:
+        get_shared_agent(vector_store)
+    except Exception as e:
+        logger.error(f"Failed to initialize shared chat agent: {str(e)}")
+
+    scheduler.add_job(refresh_rollups, "interval", minutes=ROLLUP_REFRESH_MINUTES, id="refresh_rollups", next_run_time=datetime.now())
+    # Off the event loop, so chat requests never wait for a schema poll or an agent rebuild
+    scheduler.add_job(refresh_shared_agent, "interval", seconds=SCHEMA_CHECK_INTERVAL, id="refresh_shared_agent")
+    app.state.sales_snapshot_listener = start_sales_snapshot(scheduler)
+    scheduler.start()
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    scheduler.shutdown(wait=False)
+    await close_checkpointer()
+    if app.state.sales_snapshot_listener is not None:
+        app.state.sales_snapshot_listener.set()
+
 # Root endpoint
 @app.get("/api")
 def read_root():
@@ -1,14 +1,27 @@
 from fastapi import APIRouter, Depends, HTTPException, Request
 from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
 import os
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import AsyncOpenAI, APITimeoutError
 import logging
 from pydantic import BaseModel
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 import json
 import httpx
 from tools.langchain_rag import LangChainRAG
+from tools.chat_sessions import ChatSessionStore
+from tools.admission import ChatAdmission, AdmissionRejected, SessionAdvisoryLock
+from tools.checkpointer import prune_forever, CHAT_CHECKPOINTER
+from tools.answer_cache import get_answer_cache
+from tools.sql_cache import sql_result_cache
+from tools.sql_guard import guard_stats_snapshot
+from tools.intent_router import intent_router
+from tools.telemetry import chat_telemetry, CHAT_TELEMETRY_TRAILER
+from tools.embedding_cache import get_embedding_cache
+from tools.summary_cache import SummaryCache, summary_cache_key, SUMMARY_CACHE_SERVE_STALE
+from tools.dashboard_payload import compact_dashboard_data
+import asyncio
 from fastapi.middleware.cors import CORSMiddleware
 import time
 
@@ -31,27 +44,58 @@ load_dotenv()
 # Configure OpenAI
 api_key = os.getenv('OPENAI_API_KEY')
 
-# Initialize OpenAI client with custom httpx client
-http_client = httpx.Client()
-client = OpenAI(
+# Dashboard summary limits
+SUMMARY_TIMEOUT = float(os.getenv("SUMMARY_TIMEOUT", "60"))
+SUMMARY_MAX_CONCURRENCY = int(os.getenv("SUMMARY_MAX_CONCURRENCY", "8"))
+SUMMARY_MODEL = os.getenv("SUMMARY_MODEL", "gpt-4o")
+
+# Initialize async OpenAI client on a shared pooled httpx client, so summaries never block the event loop
+http_client = httpx.AsyncClient(
+    limits=httpx.Limits(max_connections=SUMMARY_MAX_CONCURRENCY * 2, max_keepalive_connections=SUMMARY_MAX_CONCURRENCY),
+    timeout=httpx.Timeout(SUMMARY_TIMEOUT, connect=10.0)
+)
+client = AsyncOpenAI(
     api_key=api_key,
     http_client=http_client
 )
+summary_semaphore = asyncio.Semaphore(SUMMARY_MAX_CONCURRENCY)
+
+# Summaries keyed by the content of the dashboard, so identical views are generated once
+summary_cache = SummaryCache()
+
+# Bounded registry of chat sessions; each session is a thread on the shared agent
+chat_sessions = ChatSessionStore()
+
+# Limits concurrent agent runs and serializes the turns of each session, across
+# workers when they share the Postgres checkpointer
+chat_admission = ChatAdmission(session_lock=SessionAdvisoryLock() if CHAT_CHECKPOINTER == "postgres" else None)
+
+checkpoint_pruner = None
+
+@router.on_event("startup")
+async def start_session_sweeper():
+    global checkpoint_pruner
+    chat_sessions.start_sweeper()
+    checkpoint_pruner = asyncio.create_task(prune_forever())
 
-# Initialize dictionary to store RAG agents per session
-rag_agents = {}
-session_timestamps = {}
-SESSION_TIMEOUT = 43200  # 12 hours
+@router.on_event("shutdown")
+async def stop_session_sweeper():
+    chat_sessions.stop_sweeper()
+    if checkpoint_pruner is not None:
+        checkpoint_pruner.cancel()
+    if chat_admission.session_lock is not None:
+        await chat_admission.session_lock.close()
+    await http_client.aclose()
 
-def init_rag_agent(request: Request = None):
+async def init_rag_agent(request: Request = None):
     try:
         vector_store = request.app.state.vector_store if request else None
         new_agent = LangChainRAG(vector_store=vector_store)
         session_id = new_agent.config['configurable']['thread_id']
-        rag_agents[session_id] = new_agent
-        session_timestamps[session_id] = time.time()
+        await new_agent.start_thread()
+        await chat_sessions.create(session_id)
         logger.info(f" New session created: {session_id}")
-        logger.info(f" Active sessions: {len(rag_agents)}")
+        logger.info(f" Active sessions: {len(chat_sessions)}")
         return session_id
     except Exception as e:
         logger.error(f"Failed to initialize LangChainRAG agent: {str(e)}")
@@ -61,10 +105,14 @@ def init_rag_agent(request: Request = None):
 class DashboardSummaryRequest(BaseModel):
     dashboard_data: Dict[str, Any]
     brand: str
+    # Serve an expired cached summary while a fresh one is generated in the background
+    allow_stale: Optional[bool] = None
 
 # Pydantic model for chat request
 class ChatRequest(BaseModel):
     message: str
+    # End the stream with a per-stage timing event, defaults to CHAT_TELEMETRY_TRAILER
+    telemetry: Optional[bool] = None
 
 @router.post("/dashboard-summary")
 async def get_dashboard_summary(request: DashboardSummaryRequest):
@@ -75,7 +123,13 @@ async def get_dashboard_summary(request: DashboardSummaryRequest):
         # logger.info(f"Received request for brand: {request.brand}")
         # logger.debug(f"Dashboard data: {json.dumps(request.dashboard_data, indent=2)}")
         
-        result = generate_dashboard_summary(request.dashboard_data, request.brand)
+        dashboard_data = compact_dashboard_data(request.dashboard_data)
+        key = summary_cache_key(dashboard_data, request.brand, SUMMARY_MODEL)
+        result = await summary_cache.get_or_generate(
+            key,
+            lambda: generate_dashboard_summary(dashboard_data, request.brand),
+            serve_stale=SUMMARY_CACHE_SERVE_STALE if request.allow_stale is None else request.allow_stale
+        )
         # logger.info(f"Generated summary status: {result['status']}")
         
         if result["status"] == "error":
@@ -86,67 +140,104 @@ async def get_dashboard_summary(request: DashboardSummaryRequest):
         logger.error(f"Error in get_dashboard_summary endpoint: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/dashboard-summary/stream")
+async def stream_dashboard_summary_endpoint(request: DashboardSummaryRequest):
+    """
+    Stream an AI summary for dashboard data as server-sent events
+    """
+    try:
+        dashboard_data = compact_dashboard_data(request.dashboard_data)
+        key = summary_cache_key(dashboard_data, request.brand, SUMMARY_MODEL)
+        return StreamingResponse(
+            stream_dashboard_summary(dashboard_data, request.brand, key),
+            media_type="text/event-stream",
+            headers={
+                "Cache-Control": "no-cache",
+                "Connection": "keep-alive",
+                "Content-Type": "text/event-stream;charset=utf-8"
+            }
+        )
+    except Exception as e:
+        logger.error(f"Error in stream_dashboard_summary endpoint: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
 @router.post("/chat")
 async def chat_with_agent(request: Request, chat_request: ChatRequest):
     """
     Chat with the AI agent using RAG (Retrieval Augmented Generation)
     """
+    ticket = None
     try:
         session_id = request.headers.get("session-id")
         logger.info(f"🔄 Incoming chat request with session: {session_id}")
         
         # Create new session if none exists
-        if not session_id or session_id not in rag_agents.keys():
+        if not session_id or session_id not in chat_sessions:
             if not session_id:
                 logger.info("❌ No session ID provided")
-                session_id = init_rag_agent(request)
+                session_id = await init_rag_agent(request)
             else:
-                logger.info(f"❌ Session {session_id} not found")
-                return JSONResponse(
-                    content={"status": "session no valid", "message": "Your Session is Invalid"},
-                    status_code=401
-                )
+                # The session may have been started on another worker or before a restart
+                status = await chat_sessions.adopt(session_id)
+                if status == "missing":
+                    logger.info(f"❌ Session {session_id} not found")
+                    return JSONResponse(
+                        content={"status": "session no valid", "message": "Your Session is Invalid"},
+                        status_code=401
+                    )
+                if status == "expired":
+                    logger.info(f"❌ Session {session_id} has expired")
+                    return JSONResponse(
+                        content={"status": "session expired", "message": "Your Session is expired"},
+                        status_code=401
+                    )
         
         # Check if session has expired
-        if session_id in session_timestamps and time.time() - session_timestamps[session_id] > SESSION_TIMEOUT:
+        if await chat_sessions.is_expired(session_id):
             logger.info(f"❌ Session {session_id} has expired")
             return JSONResponse(
                 content={"status": "session expired", "message": "Your Session is expired"},
                 status_code=401
             )
-            
-        logger.info(f" rag agents keys: {rag_agents.keys()}")
         
         # Update session timestamp
-        session_timestamps[session_id] = time.time()
+        chat_sessions.touch(session_id)
         logger.info(f"✅ Using session: {session_id}")
         
-        # Get the agent for this session
-        rag_agent = rag_agents[session_id]
+        # Get the agent for this session; built before taking a slot, so a failure holds no lock
+        rag_agent = LangChainRAG(thread_id=session_id)
+        
+        # Wait for this session's previous turn and a free run slot
+        try:
+            ticket = await chat_admission.acquire(session_id)
+        except AdmissionRejected as e:
+            logger.info(f"⏳ Chat request for session {session_id} rejected: {str(e)}")
+            return JSONResponse(
+                content={"status": "busy", "message": "Too many chat requests, please try again shortly"},
+                status_code=429,
+                headers={"Retry-After": str(e.retry_after), "session-id": session_id}
+            )
         
         async def event_generator():
             try:
-                current_chunk = ""
-                async for chunk in rag_agent.run_agent(chat_request.message):
-                    if chunk:
-                        try:
-                            # Parse the chunk as JSON
-                            chunk_data = json.loads(chunk)
-                            if chunk_data.get("text"):
-                                # Send the text chunk
-                                yield f"data: {json.dumps(chunk_data)}\n\n"
-                        except json.JSONDecodeError:
-                            # If chunk is not JSON, send it as raw text
-                            yield f"data: {json.dumps({'text': chunk})}\n\n"
+                # run_agent yields complete SSE frames, pass them straight through
+                telemetry = CHAT_TELEMETRY_TRAILER if chat_request.telemetry is None else chat_request.telemetry
+                async for frame in rag_agent.run_agent(chat_request.message, telemetry=telemetry):
+                    yield frame
                 yield "data: [DONE]\n\n"
+                await chat_sessions.enforce_history_cap(session_id, rag_agent.agent, rag_agent.config)
             except Exception as e:
                 logger.error(f"Error in event_generator: {str(e)}")
                 error_message = json.dumps({"error": str(e)})
                 yield f"data: {error_message}\n\n"
                 yield "data: [DONE]\n\n"
+            finally:
+                ticket.release()
         
         response = StreamingResponse(
             event_generator(),
+            # Also releases the slot when the client left before streaming started
+            background=BackgroundTask(ticket.release),
             media_type="text/event-stream",
             headers={
                 "Cache-Control": "no-cache",
@@ -162,6 +253,9 @@ async def chat_with_agent(request: Request, chat_request: ChatRequest):
         )
         return response
     except Exception as e:
+        # Released here only when the response never took it over
+        if ticket is not None:
+            ticket.release()
         logger.error(f"Error in chat_with_agent endpoint: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -169,11 +263,10 @@ async def chat_with_agent(request: Request, chat_request: ChatRequest):
 async def reset_agent(request: Request):
     try:
         session_id = request.headers.get("session-id")
-        if session_id and session_id in rag_agents:
-            # Clean up old session
+        if session_id:
+            # Clean up old session, wherever it was started
             logger.info(f"Cleaning up session: {session_id}")
-            del rag_agents[session_id]
-            del session_timestamps[session_id]
+            await chat_sessions.remove(session_id)
             
         # Create new session
         new_session_id = ""
@@ -186,18 +279,27 @@ async def reset_agent(request: Request):
         logger.error(f"Error reinitializing agent: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
-def generate_dashboard_summary(dashboard_data, brand):
-    """
-    Generate an AI summary of the entire dashboard data
-    """
-    try:
-        # logger.info(f"Generating summary for brand: {brand}")
-        
-        # Prepare the prompt with dashboard data
-        prompt = f"""Analyze this dashboard data for {brand} and provide a comprehensive business summary:
+@router.get("/metrics")
+async def get_ai_metrics():
+    """Runtime metrics of the AI endpoints"""
+    return {
+        "sessions": chat_sessions.stats(),
+        "admission": chat_admission.stats(),
+        "summaryCache": summary_cache.stats(),
+        "answerCache": get_answer_cache().stats() if get_answer_cache() else {"enabled": False},
+        "sqlCache": sql_result_cache.stats(),
+        "sqlGuard": guard_stats_snapshot(),
+        "intentRouter": intent_router.stats(),
+        "chatTelemetry": chat_telemetry.stats(),
+        "embeddingCache": get_embedding_cache().stats() if get_embedding_cache() else {"enabled": False}
+    }
+
+def build_summary_messages(dashboard_data, brand):
+    """Chat messages asking for the summary of an already compacted dashboard"""
+    prompt = f"""Analyze this dashboard data for {brand} and provide a comprehensive business summary:
 
         Brand: {brand}
-        Dashboard Data: {json.dumps(dashboard_data, indent=2)}
+        Dashboard Data: {json.dumps(dashboard_data, separators=(",", ":"))}
 
         Please provide:
         1. Key performance insights
@@ -207,20 +309,30 @@ def generate_dashboard_summary(dashboard_data, brand):
         the summary should be easy to understand. use high level perspective like we talk to CEOs.
         do not use list, use numbering and paragraphs to explain the data. reposonse should be short and clear.
         """
+    return [
+        {"role": "system", "content": "You are a business analytics expert who provides clear, actionable insights from dashboard data."},
+        {"role": "user", "content": prompt}
+    ]
+
+async def generate_dashboard_summary(dashboard_data, brand):
+    """
+    Generate an AI summary of the entire dashboard data
+    """
+    try:
+        # logger.info(f"Generating summary for brand: {brand}")
         
-        # logger.debug(f"Generated prompt: {prompt}")
+        messages = build_summary_messages(dashboard_data, brand)
 
-        # Call OpenAI API
+        # Call OpenAI API, at most SUMMARY_MAX_CONCURRENCY at a time per worker
         # logger.info("Calling OpenAI API...")
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": "You are a business analytics expert who provides clear, actionable insights from dashboard data."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.7,
-            max_tokens=1000
-        )
+        async with summary_semaphore:
+            response = await client.chat.completions.create(
+                model=SUMMARY_MODEL,
+                messages=messages,
+                temperature=0.7,
+                max_tokens=1000,
+                timeout=SUMMARY_TIMEOUT
+            )
         # logger.info("Received response from OpenAI API")
 
         # Extract the summary
@@ -230,12 +342,73 @@ def generate_dashboard_summary(dashboard_data, brand):
         return {
             "status": "success",
             "summary": summary,
-            "brand": brand
+            "brand": brand,
+            "usage": {
+                "prompt_tokens": response.usage.prompt_tokens,
+                "completion_tokens": response.usage.completion_tokens,
+                "total_tokens": response.usage.total_tokens
+            } if response.usage else {}
         }
 
+    except APITimeoutError:
+        logger.error(f"Summary generation timed out after {SUMMARY_TIMEOUT}s")
+        return {
+            "status": "error",
+            "message": "Summary generation timed out"
+        }
     except Exception as e:
         logger.error(f"Error in generate_dashboard_summary: {str(e)}", exc_info=True)
         return {
             "status": "error",
             "message": str(e)
         }
+
+async def stream_dashboard_summary(dashboard_data, brand, key):
+    """
+    Yield SSE frames of the summary as the model produces it, or the cached one at once
+    """
+    cached = summary_cache.lookup(key)
+    if cached is not None:
+        yield f"data: {json.dumps({'text': cached['summary'], 'cached': True})}\n\n"
+        yield "data: [DONE]\n\n"
+        return
+
+    parts = []
+    usage = None
+    try:
+        async with summary_semaphore:
+            stream = await client.chat.completions.create(
+                model=SUMMARY_MODEL,
+                messages=build_summary_messages(dashboard_data, brand),
+                temperature=0.7,
+                max_tokens=1000,
+                timeout=SUMMARY_TIMEOUT,
+                stream=True,
+                stream_options={"include_usage": True}
+            )
+            async for chunk in stream:
+                if chunk.usage:
+                    usage = chunk.usage
+                if chunk.choices and chunk.choices[0].delta.content:
+                    parts.append(chunk.choices[0].delta.content)
+                    yield f"data: {json.dumps({'text': chunk.choices[0].delta.content})}\n\n"
+
+        summary_cache.store(key, {
+            "status": "success",
+            "summary": "".join(parts),
+            "brand": brand,
+            "usage": {
+                "prompt_tokens": usage.prompt_tokens,
+                "completion_tokens": usage.completion_tokens,
+                "total_tokens": usage.total_tokens
+            } if usage else {}
+        }, usage.total_tokens if usage else 0)
+        yield "data: [DONE]\n\n"
+    except APITimeoutError:
+        logger.error(f"Summary stream timed out after {SUMMARY_TIMEOUT}s")
+        yield f"data: {json.dumps({'error': 'Summary generation timed out'})}\n\n"
+        yield "data: [DONE]\n\n"
+    except Exception as e:
+        logger.error(f"Error in stream_dashboard_summary: {str(e)}", exc_info=True)
+        yield f"data: {json.dumps({'error': str(e)})}\n\n"
+        yield "data: [DONE]\n\n"
@@ -1,10 +1,11 @@
 from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
-from sqlalchemy import func, desc, case, distinct
+from sqlalchemy import func, desc, case, distinct, tuple_
 from datetime import datetime, timedelta
 from typing import List, Dict, Any
 from db.database import get_db
-from db.models import Sales, SalesProducts, ProductCatalog, CustomerDemographics
+from db.models import CustomerDemographics, SalesDailyRollup
+from db.sales_snapshot import get_sales_snapshot
 import logging
 
 logger = logging.getLogger(__name__)
@@ -18,6 +19,15 @@ router = APIRouter(
 def test_endpoint():
     return {"message": "Sales routes are working!"}
 
+def rollup_filters(brand: str = None, startDate: str = None, endDate: str = None):
+    """Brand and date filters on the daily sales rollup"""
+    filters = []
+    if brand:
+        filters.append(SalesDailyRollup.brand == brand)
+    if startDate and endDate:
+        filters.append(SalesDailyRollup.day.between(startDate, endDate))
+    return filters
+
 @router.get("/daily-sales")
 async def get_daily_sales(
     brand: str = Query(None, description="Brand name to filter data"),
@@ -28,30 +38,32 @@ async def get_daily_sales(
     """Get daily sales data filtered by brand and date range"""
     try:
         if startDate and endDate:
-            query_startDate = datetime.strptime(startDate, "%Y-%m-%d")
-            query_endDate = datetime.strptime(endDate, "%Y-%m-%d")
+            query_startDate = datetime.strptime(startDate, "%Y-%m-%d").date()
+            query_endDate = datetime.strptime(endDate, "%Y-%m-%d").date()
         else:
-            query_endDate = datetime.now()
+            query_endDate = datetime.now().date()
             query_startDate = query_endDate - timedelta(days=7)
 
+        snapshot = get_sales_snapshot()
+        if snapshot is not None:
+            return snapshot.daily_sales(brand, query_startDate, query_endDate)
+
         query = db.query(
-            func.date(Sales.purchase_date).label('day'),
-            func.sum(Sales.order_value).label('orderValue')
-        ).join(
-            SalesProducts, Sales.transaction_id == SalesProducts.transaction_id
-        ).join(
-            ProductCatalog, SalesProducts.product_id == ProductCatalog.product_id
+            SalesDailyRollup.day,
+            func.sum(SalesDailyRollup.order_value).label('orderValue')
         ).filter(
-            Sales.purchase_date.between(query_startDate, query_endDate)
+            *rollup_filters(brand, query_startDate, query_endDate)
+        ).group_by(
+            SalesDailyRollup.day
+        ).order_by(
+            SalesDailyRollup.day
         )
 
-        if brand:
-            query = query.filter(ProductCatalog.brand == brand)
-
-        query = query.group_by(func.date(Sales.purchase_date))
-        
         results = query.all()
-        return [{"day": day.strftime("%a"), "orderValue": float(value)} for day, value in results]
+        return [
+            {"day": day.strftime("%Y-%m-%d"), "weekday": day.strftime("%a"), "orderValue": float(value)}
+            for day, value in results
+        ]
     except Exception as e:
         logger.error(f"Error in /daily-sales endpoint: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -65,24 +77,25 @@ async def get_product_categories(
 ):
     """Get sales volume by product category"""
     try:
-        query = db.query(
-            ProductCatalog.subcategory.label('category'),
-            func.count(distinct(Sales.transaction_id)).label('volume')
-        ).join(
-            SalesProducts, ProductCatalog.product_id == SalesProducts.product_id
-        ).join(
-            Sales, SalesProducts.transaction_id == Sales.transaction_id
-        )
+        snapshot = get_sales_snapshot()
+        if snapshot is not None:
+            return snapshot.product_categories(brand, startDate, endDate)
+
+        # A transaction with items of two brands in one subcategory is counted once
+        transactions = db.query(
+            SalesDailyRollup.subcategory,
+            func.unnest(SalesDailyRollup.transaction_ids).label('transaction_id')
+        ).filter(
+            *rollup_filters(brand, startDate, endDate)
+        ).subquery()
 
-        if brand:
-            query = query.filter(ProductCatalog.brand == brand)
-        if startDate and endDate:
-            query = query.filter(Sales.purchase_date.between(startDate, endDate))
+        query = db.query(
+            transactions.c.subcategory.label('category'),
+            func.count(distinct(transactions.c.transaction_id)).label('volume')
+        ).group_by(transactions.c.subcategory).order_by(desc('volume'))
 
-        query = query.group_by(ProductCatalog.subcategory).order_by(desc('volume'))
-        
         results = query.all()
-        return [{"category": category, "volume": volume} for category, volume in results]
+        return [{"category": category, "volume": int(volume)} for category, volume in results]
     except Exception as e:
         logger.error(f"Error in /product-categories endpoint: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -96,24 +109,20 @@ async def get_return_rates(
 ):
     """Get return rates by product category"""
     try:
-        query = db.query(
-            ProductCatalog.subcategory.label('category'),
-            (func.avg(Sales.return_rate) * 100.0).label('value')
-        ).join(
-            SalesProducts, ProductCatalog.product_id == SalesProducts.product_id
-        ).join(
-            Sales, SalesProducts.transaction_id == Sales.transaction_id
-        )
+        snapshot = get_sales_snapshot()
+        if snapshot is not None:
+            return snapshot.return_rates(brand, startDate, endDate)
 
-        if brand:
-            query = query.filter(ProductCatalog.brand == brand)
-        if startDate and endDate:
-            query = query.filter(Sales.purchase_date.between(startDate, endDate))
+        query = db.query(
+            SalesDailyRollup.subcategory.label('category'),
+            (func.sum(SalesDailyRollup.return_rate_sum) * 100.0 /
+             func.nullif(func.sum(SalesDailyRollup.return_rate_count), 0)).label('value')
+        ).filter(
+            *rollup_filters(brand, startDate, endDate)
+        ).group_by(SalesDailyRollup.subcategory)
 
-        query = query.group_by(ProductCatalog.subcategory)
-        
         results = query.all()
-        return [{"category": category, "value": float(value)} for category, value in results]
+        return [{"category": category, "value": float(value or 0)} for category, value in results]
     except Exception as e:
         logger.error(f"Error in /return-rates endpoint: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -127,84 +136,101 @@ async def get_customer_locations(
 ):
     """Get customer count by city"""
     try:
-        query = db.query(
-            CustomerDemographics.location.label('city'),
-            func.count(distinct(CustomerDemographics.customer_id)).label('customers')
-        ).join(
-            Sales, CustomerDemographics.customer_id == Sales.customer_id
-        ).join(
-            SalesProducts, Sales.transaction_id == SalesProducts.transaction_id
-        ).join(
-            ProductCatalog, SalesProducts.product_id == ProductCatalog.product_id
-        )
+        snapshot = get_sales_snapshot()
+        if snapshot is not None:
+            return snapshot.customer_locations(brand, startDate, endDate)
 
-        if brand:
-            query = query.filter(ProductCatalog.brand == brand)
-        if startDate and endDate:
-            query = query.filter(Sales.purchase_date.between(startDate, endDate))
+        customers = db.query(
+            SalesDailyRollup.location,
+            func.unnest(SalesDailyRollup.customer_ids).label('customer_id')
+        ).filter(
+            *rollup_filters(brand, startDate, endDate)
+        ).subquery()
+
+        query = db.query(
+            customers.c.location.label('city'),
+            func.count(distinct(customers.c.customer_id)).label('customers')
+        ).group_by(customers.c.location).order_by(desc('customers')).limit(10)
 
-        query = query.group_by(CustomerDemographics.location).order_by(desc('customers')).limit(10)
-        
         results = query.all()
         return [{"city": city, "customers": customers} for city, customers in results]
     except Exception as e:
         logger.error(f"Error in /customer-locations endpoint: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+# Breakdowns supported by /demographics, with the response key and label field of each
+DEMOGRAPHIC_DIMENSIONS = {
+    "location": ("location", "name"),
+    "gender": ("gender", "name"),
+    "age_group": ("age", "group")
+}
+
 @router.get("/demographics")
 async def get_demographics(
     brand: str = Query(None, description="Brand name to filter data"),
     startDate: str = Query(None, description="Start date for filtering (YYYY-MM-DD)"),
     endDate: str = Query(None, description="End date for filtering (YYYY-MM-DD)"),
+    dims: str = Query("gender,age_group", description="Comma separated breakdowns (location, gender, age_group)"),
     db: Session = Depends(get_db)
 ):
-    """Get customer demographics (gender and age distribution)"""
+    """Get customer demographics distribution for the requested dimensions"""
+    requested = [d.strip() for d in dims.split(",") if d.strip()]
+    invalid = [d for d in requested if d not in DEMOGRAPHIC_DIMENSIONS]
+    if invalid or not requested:
+        raise HTTPException(status_code=400, detail=f"Unsupported dims: {', '.join(invalid) or dims}")
     try:
-        # Base subquery to get distinct customers
+        snapshot = get_sales_snapshot()
+        if snapshot is not None:
+            distribution = snapshot.demographics(requested, brand, startDate, endDate)
+            response = {"total": distribution["total"]}
+            for dim in requested:
+                key, label = DEMOGRAPHIC_DIMENSIONS[dim]
+                response[key] = [{label: value, "value": share} for value, share in distribution[dim]]
+            return response
+
+        # Distinct customers who bought the brand in the date range, read from the rollup
+        customer_ids = db.query(
+            func.unnest(SalesDailyRollup.customer_ids).label('customer_id')
+        ).filter(
+            *rollup_filters(brand, startDate, endDate)
+        ).distinct().subquery()
+
         base_query = db.query(
             CustomerDemographics.customer_id,
-            CustomerDemographics.gender,
-            CustomerDemographics.age_group
+            *[getattr(CustomerDemographics, dim) for dim in requested]
         ).join(
-            Sales, CustomerDemographics.customer_id == Sales.customer_id
-        ).join(
-            SalesProducts, Sales.transaction_id == SalesProducts.transaction_id
-        ).join(
-            ProductCatalog, SalesProducts.product_id == ProductCatalog.product_id
+            customer_ids, CustomerDemographics.customer_id == customer_ids.c.customer_id
         )
 
-        if brand:
-            base_query = base_query.filter(ProductCatalog.brand == brand)
-        if startDate and endDate:
-            base_query = base_query.filter(Sales.purchase_date.between(startDate, endDate))
-
-        # Get distinct customers subquery
-        distinct_customers = base_query.distinct().subquery()
-
-        # Gender distribution
-        total_customers = db.query(func.count(distinct(distinct_customers.c.customer_id))).scalar()
-        
-        gender_query = db.query(
-            distinct_customers.c.gender.label('name'),
-            (func.count(distinct_customers.c.customer_id) * 100.0 / total_customers).label('value')
-        ).group_by(distinct_customers.c.gender)
-        
-        gender_results = gender_query.all()
-        gender_data = [{"name": name, "value": float(value)} for name, value in gender_results]
-
-        # Age distribution
-        age_query = db.query(
-            distinct_customers.c.age_group.label('group'),
-            (func.count(distinct_customers.c.customer_id) * 100.0 / total_customers).label('value')
-        ).group_by(distinct_customers.c.age_group)
-        
-        age_results = age_query.all()
-        age_data = [{"group": group, "value": float(value)} for group, value in age_results]
-
-        return {
-            "gender": gender_data,
-            "age": age_data
-        }
+        distinct_customers = base_query.distinct().cte('distinct_customers')
+
+        # One GROUPING SETS pass yields the total and every breakdown
+        columns = [distinct_customers.c[dim] for dim in requested]
+        results = db.query(
+            *columns,
+            *[func.grouping(column).label(f'{dim}_grouped') for dim, column in zip(requested, columns)],
+            func.count().label('customers')
+        ).group_by(
+            func.grouping_sets(tuple_(), *[tuple_(column) for column in columns])
+        ).all()
+
+        total_customers = 0
+        breakdowns = {dim: [] for dim in requested}
+        for row in results:
+            grouped = [dim for dim in requested if getattr(row, f'{dim}_grouped') == 0]
+            if not grouped:
+                total_customers = row.customers
+            else:
+                breakdowns[grouped[0]].append((getattr(row, grouped[0]), row.customers))
+
+        response = {"total": total_customers}
+        for dim in requested:
+            key, label = DEMOGRAPHIC_DIMENSIONS[dim]
+            response[key] = [
+                {label: value, "value": float(customers * 100.0 / total_customers) if total_customers else 0.0}
+                for value, customers in breakdowns[dim]
+            ]
+        return response
     except Exception as e:
         logger.error(f"Error in /demographics endpoint: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
@@ -1,10 +1,12 @@
 from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
-from sqlalchemy import func, desc
+from sqlalchemy import func, desc, and_, or_, tuple_, literal
 from datetime import datetime, timedelta
 from typing import List, Dict, Any
+import base64
+import json
 from db.database import get_db
-from db.models import SocialMedia, SentimentSocialMedia, Campaign
+from db.models import SocialMedia, SentimentSocialMedia, Campaign, CollaboratorDailyStats
 import logging
 
 logger = logging.getLogger(__name__)
@@ -267,52 +269,179 @@ async def get_platform_performance(
         logger.error(f"Error in /platform-performance endpoint: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+TOP_POST_METRICS = ("reach", "engagement")
+
+def encode_cursor(positions: Dict[str, Any]) -> str:
+    """Encode the last (value, post id) seen per metric as an opaque cursor"""
+    return base64.urlsafe_b64encode(json.dumps(positions).encode()).decode()
+
+def is_cursor_position(position: Any) -> bool:
+    """None (metric exhausted) or [metric value, post id]"""
+    if position is None:
+        return True
+    return (
+        isinstance(position, list) and len(position) == 2
+        and isinstance(position[0], (int, float)) and not isinstance(position[0], bool)
+        and isinstance(position[1], int) and not isinstance(position[1], bool)
+    )
+
+def decode_cursor(cursor: str) -> Dict[str, Any]:
+    try:
+        positions = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(positions, dict) or not all(
+        metric in TOP_POST_METRICS and is_cursor_position(position)
+        for metric, position in positions.items()
+    ):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return positions
+
+def rank_top_posts(
+    db: Session,
+    metrics: List[str],
+    n: int,
+    brand: str = None,
+    startDate: str = None,
+    endDate: str = None,
+    cursor: Dict[str, Any] = None
+) -> Dict[str, List[Dict[str, Any]]]:
+    """Rank posts by several metrics in a single windowed query.
+
+    Each metric gets its own row_number() window over the same filtered scan.
+    With a cursor, rows at or above the last seen (value, post id) of a metric
+    fall into a separate partition so ranking restarts right after the cursor.
+    """
+    cursor = cursor or {}
+
+    posts = db.query(
+        SocialMedia.social_media_post_id.label('id'),
+        SocialMedia.post_text,
+        SocialMedia.jenis_konten,
+        SocialMedia.post_date,
+        SocialMedia.platform,
+        SocialMedia.collabs,
+        SocialMedia.hashtags,
+        func.coalesce(SocialMedia.reach_count, 0).label('reach'),
+        func.coalesce(SentimentSocialMedia.total_likes + SentimentSocialMedia.total_replies, 0).label('engagement')
+    ).join(
+        SentimentSocialMedia,
+        SocialMedia.social_media_post_id == SentimentSocialMedia.id_post
+    )
+
+    if brand:
+        posts = posts.filter(SocialMedia.brand == brand)
+    if startDate and endDate:
+        posts = posts.filter(SocialMedia.post_date.between(startDate, endDate))
+
+    posts = posts.subquery('posts')
+
+    window_columns = []
+    page_filters = []
+    for metric in metrics:
+        column = posts.c[metric]
+        position = cursor.get(metric)
+        if metric in cursor and position is None:
+            # This metric was exhausted on a previous page
+            continue
+        if position:
+            after_cursor = tuple_(column, posts.c.id) < tuple_(position[0], position[1])
+        else:
+            after_cursor = literal(True)
+        rank = func.row_number().over(
+            partition_by=after_cursor,
+            order_by=(column.desc(), posts.c.id.desc())
+        )
+        window_columns.append(after_cursor.label(f'{metric}_after'))
+        window_columns.append(rank.label(f'{metric}_rank'))
+
+    result = {metric: [] for metric in metrics}
+    if not window_columns:
+        return result
+
+    ranked = db.query(*posts.c, *window_columns).subquery('ranked')
+    for metric in metrics:
+        if f'{metric}_rank' in ranked.c:
+            page_filters.append(and_(
+                ranked.c[f'{metric}_after'],
+                ranked.c[f'{metric}_rank'] <= n
+            ))
+
+    rows = db.query(ranked).filter(or_(*page_filters)).all()
+
+    for row in rows:
+        for metric in metrics:
+            rank = getattr(row, f'{metric}_rank', None)
+            if rank is not None and getattr(row, f'{metric}_after') and rank <= n:
+                result[metric].append((rank, row))
+
+    for metric in metrics:
+        result[metric] = [row for _, row in sorted(result[metric], key=lambda item: item[0])]
+    return result
+
+def format_post(row) -> Dict[str, Any]:
+    return {
+        "id": row.id,
+        "caption": row.post_text,
+        "type": row.jenis_konten,
+        "timestamp": row.post_date.strftime("%Y-%m-%d %H:%M"),
+        "engagement": row.engagement,
+        "reach": row.reach,
+        "platform": row.platform,
+        "collabs": row.collabs,
+        "hashtags": row.hashtags
+    }
+
+@router.get("/top-posts")
+async def get_top_posts(
+    brand: str = Query(None, description="Brand name to filter data"),
+    startDate: str = Query(None, description="Start date for filtering (YYYY-MM-DD)"),
+    endDate: str = Query(None, description="End date for filtering (YYYY-MM-DD)"),
+    metrics: str = Query("reach,engagement", description="Comma separated metrics to rank by (reach, engagement)"),
+    n: int = Query(5, ge=1, le=100, description="Number of posts per metric"),
+    cursor: str = Query(None, description="Cursor returned by the previous page"),
+    db: Session = Depends(get_db)
+):
+    """Get top N posts for several metrics in one query, with keyset pagination"""
+    requested = [m.strip() for m in metrics.split(",") if m.strip()]
+    invalid = [m for m in requested if m not in TOP_POST_METRICS]
+    if invalid or not requested:
+        raise HTTPException(status_code=400, detail=f"Unsupported metrics: {', '.join(invalid) or metrics}")
+    positions = decode_cursor(cursor) if cursor else None
+    try:
+        ranked = rank_top_posts(db, requested, n, brand, startDate, endDate, positions)
+
+        next_positions = {}
+        for metric, rows in ranked.items():
+            if len(rows) == n:
+                last = rows[-1]
+                next_positions[metric] = [getattr(last, metric), last.id]
+            else:
+                next_positions[metric] = None
+
+        response = {
+            f"by{metric.capitalize()}": [format_post(row) for row in rows]
+            for metric, rows in ranked.items()
+        }
+        has_more = any(position is not None for position in next_positions.values())
+        response["nextCursor"] = encode_cursor(next_positions) if has_more else None
+        return response
+    except Exception as e:
+        logger.error(f"Error in /top-posts endpoint: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @router.get("/top-posts/reach")
 async def get_top_posts_by_reach(
     brand: str = Query(None, description="Brand name to filter data"),
     startDate: str = Query(None, description="Start date for filtering (YYYY-MM-DD)"),
     endDate: str = Query(None, description="End date for filtering (YYYY-MM-DD)"),
+    n: int = Query(5, ge=1, le=100, description="Number of posts"),
     db: Session = Depends(get_db)
 ):
-    """Get top 5 posts by reach filtered by brand and date range"""
-    # logger.info(f"Processing /top-posts/reach endpoint request for brand: {brand}, date range: {startDate} to {endDate}")
+    """Get top posts by reach filtered by brand and date range"""
     try:
-        # Base query
-        query = db.query(
-            SocialMedia,
-            (SentimentSocialMedia.total_likes + SentimentSocialMedia.total_replies).label('total_engagement')
-        ).join(
-            SentimentSocialMedia,
-            SocialMedia.social_media_post_id == SentimentSocialMedia.id_post
-        )
-        
-        # Apply brand filter if provided
-        if brand:
-            query = query.filter(SocialMedia.brand == brand)
-        
-        # Apply date filters if provided
-        if startDate and endDate:
-            # logger.info(f"Applying date filter: {startDate} to {endDate}")
-            query = query.filter(SocialMedia.post_date.between(startDate, endDate))
-        
-        posts = query.order_by(
-            desc(SocialMedia.reach_count)
-        ).limit(5).all()
-        
-        result = []
-        for post, engagement in posts:
-            result.append({
-                "caption": post.post_text,
-                "type": post.jenis_konten,
-                "timestamp": post.post_date.strftime("%Y-%m-%d %H:%M"),
-                "engagement": engagement,
-                "reach": post.reach_count,
-                "platform": post.platform,
-                "collabs": post.collabs,
-                "hashtags": post.hashtags
-            })
-        # logger.info(f"Returning top-posts/reach response: {result}")
-        return result
+        ranked = rank_top_posts(db, ["reach"], n, brand, startDate, endDate)
+        return [format_post(row) for row in ranked["reach"]]
     except Exception as e:
         logger.error(f"Error in /top-posts/reach endpoint: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -322,45 +451,13 @@ async def get_top_posts_by_engagement(
     brand: str = Query(None, description="Brand name to filter data"),
     startDate: str = Query(None, description="Start date for filtering (YYYY-MM-DD)"),
     endDate: str = Query(None, description="End date for filtering (YYYY-MM-DD)"),
+    n: int = Query(5, ge=1, le=100, description="Number of posts"),
     db: Session = Depends(get_db)
 ):
-    """Get top 5 posts by engagement filtered by brand and date range"""
-    # logger.info(f"Processing /top-posts/engagement endpoint request for brand: {brand}, date range: {startDate} to {endDate}")
+    """Get top posts by engagement filtered by brand and date range"""
     try:
-        # Base query
-        query = db.query(
-            SocialMedia,
-            (SentimentSocialMedia.total_likes + SentimentSocialMedia.total_replies).label('total_engagement')
-        ).join(
-            SentimentSocialMedia,
-            SocialMedia.social_media_post_id == SentimentSocialMedia.id_post
-        )
-        
-        # Apply brand filter if provided
-        if brand:
-            query = query.filter(SocialMedia.brand == brand)
-        
-        # Apply date filters if provided
-        if startDate and endDate:
-            query = query.filter(SocialMedia.post_date.between(startDate, endDate))
-        
-        top_posts = query.order_by(
-            desc('total_engagement')
-        ).limit(5).all()
-        
-        result = []
-        for post, engagement in top_posts:
-            result.append({
-                "caption": post.post_text,
-                "type": post.jenis_konten,
-                "timestamp": post.post_date.strftime("%Y-%m-%d %H:%M"),
-                "engagement": engagement,
-                "platform": post.platform,
-                "collabs": post.collabs,
-                "hashtags": post.hashtags
-            })
-        # logger.info(f"Returning top-posts/engagement response: {result}")
-        return result
+        ranked = rank_top_posts(db, ["engagement"], n, brand, startDate, endDate)
+        return [format_post(row) for row in ranked["engagement"]]
     except Exception as e:
         logger.error(f"Error in /top-posts/engagement endpoint: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -441,41 +538,30 @@ async def get_top_collaborators(
     db: Session = Depends(get_db)
 ):
     """Get top collaborators by reach and engagement filtered by brand and date range"""
-    # logger.info(f"Processing /top-collaborators endpoint request for brand: {brand}, date range: {startDate} to {endDate}")
     try:
-        # Get top collaborators by reach
+        # Leaderboards are summed from the per (brand, collabs, day) rollup
+        filters = []
+        if brand:
+            filters.append(CollaboratorDailyStats.brand == brand)
+        if startDate and endDate:
+            filters.append(CollaboratorDailyStats.day.between(startDate, endDate))
+
         reach_collabs = db.query(
-            SocialMedia.collabs,
-            func.sum(SocialMedia.reach_count).label('reach'),
-            func.count(SocialMedia.social_media_post_id).label('posts')
-        ).filter(
-            SocialMedia.brand == brand
-        ).filter(
-            SocialMedia.post_date.between(startDate, endDate)
-        ).filter(
-            SocialMedia.collabs.isnot(None)
-        ).group_by(
-            SocialMedia.collabs
+            CollaboratorDailyStats.collabs,
+            func.sum(CollaboratorDailyStats.reach).label('reach'),
+            func.sum(CollaboratorDailyStats.posts).label('posts')
+        ).filter(*filters).group_by(
+            CollaboratorDailyStats.collabs
         ).order_by(
             desc('reach')
         ).limit(5).all()
 
-        # Get top collaborators by engagement
         engagement_collabs = db.query(
-            SocialMedia.collabs,
-            func.sum(SentimentSocialMedia.total_likes + SentimentSocialMedia.total_replies).label('engagement'),
-            func.count(SocialMedia.social_media_post_id).label('posts')
-        ).join(
-            SentimentSocialMedia,
-            SocialMedia.social_media_post_id == SentimentSocialMedia.id_post
-        ).filter(
-            SocialMedia.brand == brand
-        ).filter(
-            SocialMedia.post_date.between(startDate, endDate)
-        ).filter(
-            SocialMedia.collabs.isnot(None)
-        ).group_by(
-            SocialMedia.collabs
+            CollaboratorDailyStats.collabs,
+            func.sum(CollaboratorDailyStats.engagement).label('engagement'),
+            func.sum(CollaboratorDailyStats.posts).label('posts')
+        ).filter(*filters).group_by(
+            CollaboratorDailyStats.collabs
         ).order_by(
             desc('engagement')
         ).limit(5).all()
@@ -483,8 +569,8 @@ async def get_top_collaborators(
         reach_result = [
             {
                 "tag": collab,
-                "reach": reach,
-                "posts": posts
+                "reach": int(reach),
+                "posts": int(posts)
             }
             for collab, reach, posts in reach_collabs
         ]
@@ -492,8 +578,8 @@ async def get_top_collaborators(
         engagement_result = [
             {
                 "tag": collab,
-                "engagement": engagement,
-                "posts": posts
+                "engagement": int(engagement),
+                "posts": int(posts)
             }
             for collab, engagement, posts in engagement_collabs
         ]
@@ -0,0 +1,208 @@
+from collections import deque
+from typing import Any, Dict, Optional
+from db.database import DATABASE_URL
+import asyncio
+import math
+import os
+import time
+
+# Agent runs executing at once per worker, and how many more may wait for a slot
+CHAT_MAX_CONCURRENT_RUNS = int(os.getenv("CHAT_MAX_CONCURRENT_RUNS", "8"))
+CHAT_MAX_QUEUED_RUNS = int(os.getenv("CHAT_MAX_QUEUED_RUNS", "32"))
+CHAT_QUEUE_TIMEOUT = float(os.getenv("CHAT_QUEUE_TIMEOUT", "30"))
+
+# How often a turn retries the session lock while another worker runs a turn of the same session
+SESSION_LOCK_POLL_INTERVAL = float(os.getenv("SESSION_LOCK_POLL_INTERVAL", "0.1"))
+
+# First key of the two-key advisory locks held per session; the second is hashtext(session_id)
+SESSION_LOCK_NAMESPACE = 720041
+
+class AdmissionRejected(Exception):
+    def __init__(self, retry_after: int, reason: str):
+        super().__init__(reason)
+        self.retry_after = retry_after
+
+class SessionAdvisoryLock:
+    """Postgres advisory locks running one turn of a session at a time across workers.
+
+    Sessions reach any worker, so the per-worker lock alone lets two workers
+    run turns of one thread at once. The locks are session-level locks on
+    one connection of this worker, taken with pg_try_advisory_lock and
+    polled, so a wait never blocks the connection or a checkpointer one.
+    """
+
+    def __init__(self, conninfo: str = DATABASE_URL, poll_interval: float = SESSION_LOCK_POLL_INTERVAL):
+        self.conninfo = conninfo
+        self.poll_interval = poll_interval
+        self.connection = None
+        # One statement at a time on the shared connection
+        self.lock = asyncio.Lock()
+
+    async def execute(self, statement: str, session_id: str) -> bool:
+        import psycopg
+
+        async with self.lock:
+            if self.connection is None or self.connection.closed or self.connection.broken:
+                self.connection = await psycopg.AsyncConnection.connect(self.conninfo, autocommit=True)
+            cursor = await self.connection.execute(statement, (SESSION_LOCK_NAMESPACE, session_id))
+            return (await cursor.fetchone())[0]
+
+    async def acquire(self, session_id: str) -> None:
+        while True:
+            attempt = asyncio.ensure_future(
+                self.execute("SELECT pg_try_advisory_lock(%s, hashtext(%s))", session_id)
+            )
+            try:
+                acquired = await asyncio.shield(attempt)
+            except asyncio.CancelledError:
+                # The statement may still take the lock after the wait was given up
+                attempt.add_done_callback(lambda done: self.release_if_taken(done, session_id))
+                raise
+            if acquired:
+                return
+            await asyncio.sleep(self.poll_interval)
+
+    def release_if_taken(self, attempt: asyncio.Future, session_id: str) -> None:
+        if not attempt.cancelled() and attempt.exception() is None and attempt.result():
+            asyncio.ensure_future(self.release(session_id))
+
+    async def release(self, session_id: str) -> None:
+        try:
+            await self.execute("SELECT pg_advisory_unlock(%s, hashtext(%s))", session_id)
+        except Exception:
+            # Closing the connection drops its locks, so none is left behind
+            await self.close()
+
+    async def close(self) -> None:
+        if self.connection is not None:
+            await self.connection.close()
+            self.connection = None
+
+class AdmissionTicket:
+    """A held run slot and session lock, released exactly once"""
+
+    def __init__(self, admission: "ChatAdmission", session_id: str):
+        self.admission = admission
+        self.session_id = session_id
+        self.started_at = time.monotonic()
+        self.loop = asyncio.get_running_loop()
+        self.released = False
+
+    def release(self) -> None:
+        if not self.released:
+            self.released = True
+            # Sync background tasks call this from a threadpool; the locks belong to the loop
+            try:
+                current = asyncio.get_running_loop()
+            except RuntimeError:
+                current = None
+            if current is self.loop:
+                self.admission.release(self)
+            else:
+                self.loop.call_soon_threadsafe(self.admission.release, self)
+
+class ChatAdmission:
+    """Global run limit with a bounded wait queue, plus one run at a time per session.
+
+    A session's turns wait on its lock first, in arrival order, so queued
+    turns of one session never hold global slots. With a session_lock the
+    turn then also waits for turns of the session running on other workers.
+    """
+
+    def __init__(
+        self,
+        max_running: int = CHAT_MAX_CONCURRENT_RUNS,
+        max_queued: int = CHAT_MAX_QUEUED_RUNS,
+        queue_timeout: float = CHAT_QUEUE_TIMEOUT,
+        session_lock: Optional[SessionAdvisoryLock] = None
+    ):
+        self.max_running = max_running
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self.session_lock = session_lock
+        self.semaphore = asyncio.Semaphore(max_running)
+        self.session_locks: Dict[str, asyncio.Lock] = {}
+        self.session_waiters: Dict[str, int] = {}
+        self.running = 0
+        self.queued = 0
+        self.max_queue_depth = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.waits = deque(maxlen=1000)
+        self.run_times = deque(maxlen=100)
+
+    def retry_after(self) -> int:
+        """Seconds until a slot is likely free, from recent run durations"""
+        average_run = sum(self.run_times) / len(self.run_times) if self.run_times else 5.0
+        return max(1, math.ceil(average_run * (self.queued + 1) / self.max_running))
+
+    async def acquire(self, session_id: str) -> AdmissionTicket:
+        if self.queued >= self.max_queued:
+            self.rejected += 1
+            raise AdmissionRejected(self.retry_after(), "queue full")
+
+        lock = self.session_locks.setdefault(session_id, asyncio.Lock())
+        self.session_waiters[session_id] = self.session_waiters.get(session_id, 0) + 1
+        self.queued += 1
+        self.max_queue_depth = max(self.max_queue_depth, self.queued)
+        started = time.monotonic()
+        locked = False
+        shared_locked = False
+
+        async def wait_turn():
+            nonlocal locked, shared_locked
+            await lock.acquire()
+            locked = True
+            if self.session_lock is not None:
+                await self.session_lock.acquire(session_id)
+                shared_locked = True
+            await self.semaphore.acquire()
+
+        try:
+            await asyncio.wait_for(wait_turn(), self.queue_timeout)
+        except BaseException as e:
+            if shared_locked:
+                await self.session_lock.release(session_id)
+            if locked:
+                lock.release()
+            self.forget_session(session_id)
+            if isinstance(e, asyncio.TimeoutError):
+                self.timed_out += 1
+                raise AdmissionRejected(self.retry_after(), "queue timeout")
+            raise
+        finally:
+            self.queued -= 1
+
+        self.waits.append(time.monotonic() - started)
+        self.running += 1
+        return AdmissionTicket(self, session_id)
+
+    def release(self, ticket: AdmissionTicket) -> None:
+        self.running -= 1
+        self.run_times.append(time.monotonic() - ticket.started_at)
+        self.semaphore.release()
+        if self.session_lock is not None:
+            # Unlocked after the local lock is handed on; advisory locks are reentrant per connection
+            asyncio.ensure_future(self.session_lock.release(ticket.session_id))
+        self.session_locks[ticket.session_id].release()
+        self.forget_session(ticket.session_id)
+
+    def forget_session(self, session_id: str) -> None:
+        self.session_waiters[session_id] -= 1
+        if self.session_waiters[session_id] == 0:
+            del self.session_waiters[session_id]
+            del self.session_locks[session_id]
+
+    def stats(self) -> Dict[str, Any]:
+        waits = sorted(self.waits)
+        return {
+            "running": self.running,
+            "queued": self.queued,
+            "maxRunning": self.max_running,
+            "maxQueued": self.max_queued,
+            "maxQueueDepth": self.max_queue_depth,
+            "rejected": self.rejected,
+            "timedOut": self.timed_out,
+            "avgWaitMs": round(sum(waits) / len(waits) * 1000, 1) if waits else 0.0,
+            "p95WaitMs": round(waits[int(len(waits) * 0.95)] * 1000, 1) if waits else 0.0
+        }
@@ -0,0 +1,125 @@
+from tools.model_providers import get_embeddings
+from db.rollups import get_data_version
+from typing import Any, Dict, List, Optional
+import numpy as np
+import faiss
+import asyncio
+import re
+import os
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+ANSWER_CACHE_EMBEDDING_MODEL = os.getenv("ANSWER_CACHE_EMBEDDING_MODEL", "text-embedding-3-small")
+# Cosine similarity above which two questions are treated as the same question
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.92"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1000"))
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", "86400"))
+
+def normalize_question(question: str) -> str:
+    return re.sub(r"\s+", " ", question).strip().lower()
+
+class CachedAnswer:
+    def __init__(self, question: str, answer: str, data_version: str):
+        self.question = question
+        self.answer = answer
+        self.data_version = data_version
+        self.created_at = time.time()
+
+class SemanticAnswerCache:
+    """Answers of standalone chat questions, looked up by question embedding.
+
+    Vectors are L2-normalized in a flat inner-product FAISS index, so the
+    search score is the cosine similarity. Every entry is tagged with the
+    data version it was computed against and the whole cache is dropped
+    when the version moves on.
+    """
+
+    def __init__(
+        self,
+        embeddings=None,
+        threshold: float = ANSWER_CACHE_THRESHOLD,
+        max_entries: int = ANSWER_CACHE_MAX_ENTRIES,
+        ttl: int = ANSWER_CACHE_TTL
+    ):
+        self.embeddings = embeddings
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.index: Optional[faiss.Index] = None
+        self.entries: List[CachedAnswer] = []
+        self.data_version: Optional[str] = None
+        self.hits = 0
+        self.misses = 0
+
+    def get_embeddings(self):
+        if self.embeddings is None:
+            self.embeddings = get_embeddings(ANSWER_CACHE_EMBEDDING_MODEL)
+        return self.embeddings
+
+    def clear(self) -> None:
+        self.index = None
+        self.entries = []
+
+    async def current_data_version(self) -> str:
+        version = await asyncio.to_thread(get_data_version)
+        if version != self.data_version:
+            if self.entries:
+                logger.info(f"Data version changed, dropping {len(self.entries)} cached answers")
+            self.clear()
+            self.data_version = version
+        return version
+
+    async def embed(self, question: str) -> np.ndarray:
+        vector = np.array([await self.get_embeddings().aembed_query(normalize_question(question))], dtype=np.float32)
+        faiss.normalize_L2(vector)
+        return vector
+
+    def lookup(self, vector: np.ndarray) -> Optional[str]:
+        if self.index is not None and self.entries:
+            scores, ids = self.index.search(vector, 1)
+            position = int(ids[0][0])
+            if position >= 0 and scores[0][0] >= self.threshold:
+                entry = self.entries[position]
+                if time.time() - entry.created_at <= self.ttl:
+                    self.hits += 1
+                    return entry.answer
+        self.misses += 1
+        return None
+
+    def store(self, vector: np.ndarray, question: str, answer: str, data_version: str) -> None:
+        # The answer was computed against data that has been replaced meanwhile
+        if data_version != self.data_version:
+            return
+        if self.index is None:
+            self.index = faiss.IndexFlatIP(vector.shape[1])
+        if len(self.entries) >= self.max_entries:
+            # Flat index ids are positions, removing the oldest shifts the rest down
+            self.index.remove_ids(np.arange(len(self.entries) - self.max_entries + 1, dtype=np.int64))
+            del self.entries[:len(self.entries) - self.max_entries + 1]
+        self.index.add(vector)
+        self.entries.append(CachedAnswer(question, answer, data_version))
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": ANSWER_CACHE_ENABLED,
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "threshold": self.threshold
+        }
+
+_answer_cache: Optional[SemanticAnswerCache] = None
+
+def get_answer_cache() -> Optional[SemanticAnswerCache]:
+    """The process answer cache, or None when disabled"""
+    global _answer_cache
+    if not ANSWER_CACHE_ENABLED:
+        return None
+    if _answer_cache is None:
+        _answer_cache = SemanticAnswerCache()
+    return _answer_cache
@@ -0,0 +1,203 @@
+from langchain_core.messages import HumanMessage, BaseMessage
+from collections import OrderedDict
+from tools.checkpointer import get_checkpointer, get_thread_age
+from typing import Dict, List, Optional, Any
+import asyncio
+import json
+import os
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Session limits, overridable from the environment
+MAX_CHAT_SESSIONS = int(os.getenv("MAX_CHAT_SESSIONS", "500"))
+SESSION_TIMEOUT = int(os.getenv("SESSION_TIMEOUT", "43200"))  # 12 hours
+SESSION_SWEEP_INTERVAL = int(os.getenv("SESSION_SWEEP_INTERVAL", "300"))
+MAX_SESSION_HISTORY_BYTES = int(os.getenv("MAX_SESSION_HISTORY_BYTES", "262144"))
+
+def message_bytes(message: BaseMessage) -> int:
+    """Approximate size of a message as stored in the checkpointer"""
+    size = len(message.content if isinstance(message.content, str) else json.dumps(message.content))
+    for tool_call in getattr(message, "tool_calls", None) or []:
+        size += len(json.dumps(tool_call.get("args", {}), default=str))
+    return size
+
+def trim_history(messages: List[BaseMessage], max_bytes: int) -> List[BaseMessage]:
+    """Keep the most recent messages that fit in max_bytes.
+
+    The cut always lands on a human message, so a tool call is never
+    separated from its result.
+    """
+    total = 0
+    start = None
+    for i in range(len(messages) - 1, -1, -1):
+        total += message_bytes(messages[i])
+        if isinstance(messages[i], HumanMessage):
+            if total > max_bytes and start is not None:
+                break
+            start = i
+            if total > max_bytes:
+                # The latest exchange alone is over the cap, keep it anyway
+                break
+    return messages[start:] if start is not None else []
+
+class SessionEntry:
+    def __init__(self):
+        self.created_at = time.time()
+        self.last_access = self.created_at
+        self.history_bytes = 0
+
+class ChatSessionStore:
+    """LRU-bounded registry of chat sessions living on the shared checkpointer.
+
+    The registry is per worker; the history itself is in the checkpointer,
+    so a session started on another worker is adopted on first use. Evicting
+    a session only drops it from this registry. A session idle here may be
+    active on another worker, so expiry is decided from its thread's latest
+    checkpoint, and only then is the thread deleted; reset deletes it always.
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = MAX_CHAT_SESSIONS,
+        ttl: int = SESSION_TIMEOUT,
+        max_history_bytes: int = MAX_SESSION_HISTORY_BYTES,
+        sweep_interval: int = SESSION_SWEEP_INTERVAL
+    ):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.max_history_bytes = max_history_bytes
+        self.sweep_interval = sweep_interval
+        self.sessions: "OrderedDict[str, SessionEntry]" = OrderedDict()
+        self.evicted = 0
+        self.expired = 0
+        self._sweeper: Optional[asyncio.Task] = None
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def __contains__(self, session_id: str):
+        return session_id in self.sessions
+
+    async def create(self, session_id: str, last_access: float = None) -> None:
+        while len(self.sessions) >= self.max_sessions:
+            oldest, _ = self.sessions.popitem(last=False)
+            self.evicted += 1
+            # Readopted from the checkpointer if it comes back
+            logger.info(f"Evicting least recently used session: {oldest}")
+        entry = SessionEntry()
+        if last_access is not None:
+            entry.last_access = last_access
+        self.sessions[session_id] = entry
+
+    async def adopt(self, session_id: str) -> str:
+        """Register a session created by another worker or before a restart.
+
+        Returns "ok", "missing" when the checkpointer has no such thread, or
+        "expired" when its latest checkpoint is older than the TTL.
+        """
+        age = await get_thread_age(session_id)
+        if age is None:
+            return "missing"
+        if age > self.ttl:
+            await self.delete_history(session_id)
+            return "expired"
+        await self.create(session_id, last_access=time.time() - age)
+        return "ok"
+
+    async def is_expired(self, session_id: str) -> bool:
+        """Whether the session has been idle on every worker for longer than the TTL.
+
+        The local last access is only a lower bound, so a session idle here
+        is checked against its thread's latest checkpoint before expiring.
+        An expired session is removed along with its history.
+        """
+        entry = self.sessions.get(session_id)
+        if entry is None or time.time() - entry.last_access <= self.ttl:
+            return False
+        age = await get_thread_age(session_id)
+        if age is not None and age <= self.ttl:
+            # Used on another worker meanwhile
+            entry.last_access = time.time() - age
+            return False
+        self.sessions.pop(session_id, None)
+        self.expired += 1
+        if age is not None:
+            await self.delete_history(session_id)
+        return True
+
+    def touch(self, session_id: str) -> None:
+        self.sessions[session_id].last_access = time.time()
+        self.sessions.move_to_end(session_id)
+
+    async def remove(self, session_id: str) -> None:
+        self.sessions.pop(session_id, None)
+        await self.delete_history(session_id)
+
+    async def delete_history(self, session_id: str) -> None:
+        try:
+            await get_checkpointer().adelete_thread(session_id)
+        except Exception as e:
+            logger.error(f"Failed to delete history for session {session_id}: {str(e)}")
+
+    async def sweep(self) -> int:
+        """Remove every expired session, returns how many were removed"""
+        now = time.time()
+        idle = [sid for sid, entry in self.sessions.items() if now - entry.last_access > self.ttl]
+        removed = 0
+        for session_id in idle:
+            if await self.is_expired(session_id):
+                removed += 1
+        return removed
+
+    async def sweep_forever(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                removed = await self.sweep()
+                if removed:
+                    logger.info(f"Swept {removed} expired sessions, {len(self.sessions)} active")
+            except Exception as e:
+                logger.error(f"Error sweeping sessions: {str(e)}")
+
+    def start_sweeper(self):
+        if self._sweeper is None or self._sweeper.done():
+            self._sweeper = asyncio.create_task(self.sweep_forever())
+
+    def stop_sweeper(self):
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            self._sweeper = None
+
+    async def enforce_history_cap(self, session_id: str, agent, config: Dict[str, Any]) -> None:
+        """Record the session's history size and trim it when over the cap.
+
+        Trimming rewrites the thread as a single checkpoint holding the kept
+        messages, which also drops the intermediate checkpoints of past turns.
+        """
+        entry = self.sessions.get(session_id)
+        if entry is None:
+            return
+        state = await agent.aget_state(config)
+        messages = state.values.get("messages", []) if state else []
+        entry.history_bytes = sum(message_bytes(m) for m in messages)
+        if entry.history_bytes <= self.max_history_bytes:
+            return
+
+        kept = trim_history(messages, self.max_history_bytes)
+        await self.delete_history(session_id)
+        if kept:
+            await agent.aupdate_state(config, {"messages": kept}, as_node="agent")
+        entry.history_bytes = sum(message_bytes(m) for m in kept)
+        logger.info(f"Trimmed session {session_id} history from {len(messages)} to {len(kept)} messages")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "activeSessions": len(self.sessions),
+            "maxSessions": self.max_sessions,
+            "estimatedHistoryBytes": sum(entry.history_bytes for entry in self.sessions.values()),
+            "maxHistoryBytesPerSession": self.max_history_bytes,
+            "evicted": self.evicted,
+            "expired": self.expired
+        }
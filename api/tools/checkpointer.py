@@ -0,0 +1,190 @@
+from langgraph.checkpoint.base import BaseCheckpointSaver
+from langgraph.checkpoint.memory import MemorySaver
+from typing import Optional
+from db.database import DATABASE_URL
+import asyncio
+import uuid
+import os
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Where chat history lives: "postgres" (shared by all workers), "sqlite" (local runs) or "memory"
+CHAT_CHECKPOINTER = os.getenv("CHAT_CHECKPOINTER", "postgres").lower()
+CHAT_CHECKPOINT_SQLITE_PATH = os.getenv("CHAT_CHECKPOINT_SQLITE_PATH", "chat_checkpoints.sqlite")
+CHAT_CHECKPOINT_POOL_SIZE = int(os.getenv("CHAT_CHECKPOINT_POOL_SIZE", "4"))
+
+# Threads idle for longer than this are deleted; superseded checkpoints are always pruned
+CHECKPOINT_RETENTION_SECONDS = int(os.getenv("CHECKPOINT_RETENTION_SECONDS", os.getenv("SESSION_TIMEOUT", "43200")))
+CHECKPOINT_PRUNE_INTERVAL = int(os.getenv("CHECKPOINT_PRUNE_INTERVAL", "900"))
+
+# Advisory lock key so only one worker prunes the shared checkpoints at a time
+CHECKPOINT_PRUNE_LOCK_KEY = 720033
+
+# Offset between the UUID epoch (1582-10-15) and the Unix epoch, in 100ns intervals
+UUID_EPOCH_OFFSET = 0x01B21DD213814000
+
+_checkpointer: Optional[BaseCheckpointSaver] = None
+_resource = None
+
+def get_checkpointer() -> BaseCheckpointSaver:
+    """The process checkpointer, an in-memory one until open_checkpointer() ran"""
+    global _checkpointer
+    if _checkpointer is None:
+        _checkpointer = MemorySaver()
+    return _checkpointer
+
+async def open_checkpointer() -> BaseCheckpointSaver:
+    """Open the configured durable checkpointer and create its tables"""
+    global _checkpointer, _resource
+    if CHAT_CHECKPOINTER == "postgres":
+        from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
+        from psycopg.rows import dict_row
+        from psycopg_pool import AsyncConnectionPool
+
+        _resource = AsyncConnectionPool(
+            conninfo=DATABASE_URL,
+            max_size=CHAT_CHECKPOINT_POOL_SIZE,
+            kwargs={"autocommit": True, "prepare_threshold": 0, "row_factory": dict_row},
+            open=False
+        )
+        await _resource.open()
+        _checkpointer = AsyncPostgresSaver(_resource)
+    elif CHAT_CHECKPOINTER == "sqlite":
+        from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+        import aiosqlite
+
+        _resource = await aiosqlite.connect(CHAT_CHECKPOINT_SQLITE_PATH)
+        # WAL lets several local workers read while one writes
+        await _resource.execute("PRAGMA journal_mode=WAL")
+        _checkpointer = AsyncSqliteSaver(_resource)
+    else:
+        _checkpointer = MemorySaver()
+        return _checkpointer
+
+    await _checkpointer.setup()
+    logger.info(f"Chat checkpointer ready: {CHAT_CHECKPOINTER}")
+    return _checkpointer
+
+async def close_checkpointer():
+    global _resource
+    if _resource is not None:
+        await _resource.close()
+        _resource = None
+
+def checkpoint_age(checkpoint_id: str) -> float:
+    """Seconds since a checkpoint was written, read from its UUIDv6 id"""
+    value = uuid.UUID(checkpoint_id).int
+    # UUIDv6 stores the 60-bit timestamp most significant bits first
+    ticks = ((value >> 96) << 28) | (((value >> 80) & 0xFFFF) << 12) | ((value >> 64) & 0x0FFF)
+    timestamp = (ticks - UUID_EPOCH_OFFSET) / 1e7
+    return time.time() - timestamp
+
+async def get_thread_age(thread_id: str) -> Optional[float]:
+    """Seconds since the thread's latest checkpoint, or None when it does not exist"""
+    checkpoint = await get_checkpointer().aget_tuple({"configurable": {"thread_id": thread_id}})
+    if checkpoint is None:
+        return None
+    return checkpoint_age(checkpoint.config["configurable"]["checkpoint_id"])
+
+async def prune_postgres_checkpoints(checkpointer, conn) -> int:
+    rows = await (await conn.execute(
+        "SELECT thread_id, MAX(checkpoint_id) AS latest FROM checkpoints GROUP BY thread_id"
+    )).fetchall()
+    expired = [row["thread_id"] for row in rows if checkpoint_age(row["latest"]) > CHECKPOINT_RETENTION_SECONDS]
+    for thread_id in expired:
+        await checkpointer.adelete_thread(thread_id)
+    await conn.execute("""
+        DELETE FROM checkpoints c
+        USING (
+            SELECT thread_id, checkpoint_ns, MAX(checkpoint_id) AS latest
+            FROM checkpoints GROUP BY thread_id, checkpoint_ns
+        ) l
+        WHERE c.thread_id = l.thread_id
+          AND c.checkpoint_ns = l.checkpoint_ns
+          AND c.checkpoint_id < l.latest
+    """)
+    await conn.execute("""
+        DELETE FROM checkpoint_writes w
+        WHERE NOT EXISTS (
+            SELECT 1 FROM checkpoints c
+            WHERE c.thread_id = w.thread_id
+              AND c.checkpoint_ns = w.checkpoint_ns
+              AND c.checkpoint_id = w.checkpoint_id
+        )
+    """)
+    # Blobs hold channel values; keep only the versions the latest checkpoints point at
+    await conn.execute("""
+        DELETE FROM checkpoint_blobs b
+        WHERE NOT EXISTS (
+            SELECT 1 FROM checkpoints c
+            WHERE c.thread_id = b.thread_id
+              AND c.checkpoint_ns = b.checkpoint_ns
+              AND c.checkpoint -> 'channel_versions' ->> b.channel = b.version
+        )
+    """)
+    return len(expired)
+
+async def prune_checkpoints() -> int:
+    """Delete idle threads and every checkpoint older than its thread's latest one.
+
+    Returns the number of deleted threads.
+    """
+    checkpointer = get_checkpointer()
+    if isinstance(checkpointer, MemorySaver):
+        return 0
+
+    if CHAT_CHECKPOINTER == "postgres":
+        async with checkpointer.conn.connection() as conn:
+            # Every worker schedules the pruning; the others skip the run while one holds the lock
+            locked = (await (await conn.execute(
+                "SELECT pg_try_advisory_lock(%s) AS locked", (CHECKPOINT_PRUNE_LOCK_KEY,)
+            )).fetchone())["locked"]
+            if not locked:
+                return 0
+            try:
+                return await prune_postgres_checkpoints(checkpointer, conn)
+            finally:
+                await conn.execute("SELECT pg_advisory_unlock(%s)", (CHECKPOINT_PRUNE_LOCK_KEY,))
+
+    if CHAT_CHECKPOINTER == "sqlite":
+        conn = checkpointer.conn
+        async with conn.execute(
+            "SELECT thread_id, MAX(checkpoint_id) FROM checkpoints GROUP BY thread_id"
+        ) as cursor:
+            rows = await cursor.fetchall()
+        expired = [thread_id for thread_id, latest in rows if checkpoint_age(latest) > CHECKPOINT_RETENTION_SECONDS]
+        for thread_id in expired:
+            await checkpointer.adelete_thread(thread_id)
+        await conn.execute("""
+            DELETE FROM checkpoints
+            WHERE checkpoint_id < (
+                SELECT MAX(l.checkpoint_id) FROM checkpoints l
+                WHERE l.thread_id = checkpoints.thread_id
+                  AND l.checkpoint_ns = checkpoints.checkpoint_ns
+            )
+        """)
+        await conn.execute("""
+            DELETE FROM writes
+            WHERE NOT EXISTS (
+                SELECT 1 FROM checkpoints c
+                WHERE c.thread_id = writes.thread_id
+                  AND c.checkpoint_ns = writes.checkpoint_ns
+                  AND c.checkpoint_id = writes.checkpoint_id
+            )
+        """)
+        await conn.commit()
+        return len(expired)
+
+    return 0
+
+async def prune_forever():
+    while True:
+        await asyncio.sleep(CHECKPOINT_PRUNE_INTERVAL)
+        try:
+            removed = await prune_checkpoints()
+            if removed:
+                logger.info(f"Pruned {removed} idle chat threads")
+        except Exception as e:
+            logger.error(f"Error pruning checkpoints: {str(e)}")
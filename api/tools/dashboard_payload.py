@@ -0,0 +1,106 @@
+from typing import Any
+import re
+import os
+
+# Chart.js presentation keys that carry no information for the summary; only
+# stripped from chart configs, their datasets and the chart data object
+STYLE_KEYS = {
+    "backgroundColor", "borderColor", "borderWidth", "borderDash", "borderRadius",
+    "hoverBackgroundColor", "hoverBorderColor", "hoverBorderWidth", "hoverOffset",
+    "pointBackgroundColor", "pointBorderColor", "pointRadius", "pointHoverRadius",
+    "pointStyle", "fill", "tension", "barThickness", "maxBarThickness", "options"
+}
+
+# Keys and label formats marking a list as a time series
+TIME_KEYS = {"date", "day", "week", "month", "year", "period", "time", "timestamp", "post_date", "purchase_date", "review_date"}
+TIME_LABEL_PATTERN = re.compile(
+    r"^(\d{4}-\d{2}(-\d{2})?|\d{1,2}/\d{1,2}/\d{2,4}|(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec|mei|agu|okt|des)\w*\.?( \d{2,4})?$|q[1-4] \d{4}$)",
+    re.IGNORECASE
+)
+
+SUMMARY_MAX_SERIES_POINTS = int(os.getenv("SUMMARY_MAX_SERIES_POINTS", "24"))
+SUMMARY_NUMBER_DECIMALS = int(os.getenv("SUMMARY_NUMBER_DECIMALS", "2"))
+
+def round_number(value: float) -> Any:
+    # Large values only need integer precision for a CEO-level summary
+    if abs(value) >= 100:
+        return int(round(value))
+    return round(value, SUMMARY_NUMBER_DECIMALS)
+
+def sample_series(values: list, max_points: int) -> list:
+    """Evenly spaced points of a series, always keeping the first and last one.
+
+    The positions depend only on the length, so parallel label and data
+    arrays stay aligned.
+    """
+    if len(values) <= max_points or max_points < 2:
+        return values
+    step = (len(values) - 1) / (max_points - 1)
+    return [values[round(i * step)] for i in range(max_points)]
+
+def is_ordered_series(values: list) -> bool:
+    """Whether a list is a time or numeric series rather than a ranking.
+
+    Sampling keeps the shape of a series, while a ranking (top posts,
+    categories, locations) must keep its head.
+    """
+    if not values:
+        return False
+    if all(isinstance(value, (int, float)) and not isinstance(value, bool) for value in values):
+        return True
+    if all(isinstance(value, str) and TIME_LABEL_PATTERN.match(value.strip()) for value in values):
+        return True
+    return all(isinstance(value, dict) and TIME_KEYS & set(value) for value in values)
+
+def shorten(values: list, max_points: int, ordered: bool) -> list:
+    return sample_series(values, max_points) if ordered else values[:max_points]
+
+def is_chart_data(data: dict) -> bool:
+    return isinstance(data.get("datasets"), list)
+
+def is_chart_config(data: dict) -> bool:
+    return isinstance(data.get("data"), dict) and is_chart_data(data["data"])
+
+def compact_chart_data(data: dict, max_points: int) -> dict:
+    """Labels and every dataset shortened the same way, so they stay aligned"""
+    labels = data.get("labels")
+    ordered = is_ordered_series(labels) if isinstance(labels, list) else True
+    compacted = {}
+    for key, value in data.items():
+        if key in STYLE_KEYS or value is None:
+            continue
+        if key == "labels" and isinstance(value, list):
+            compacted[key] = compact_dashboard_data(shorten(value, max_points, ordered), max_points)
+        elif key == "datasets":
+            compacted[key] = [
+                {
+                    name: compact_dashboard_data(shorten(field, max_points, ordered), max_points)
+                    if name == "data" and isinstance(field, list) else compact_dashboard_data(field, max_points)
+                    for name, field in dataset.items() if name not in STYLE_KEYS and field is not None
+                } if isinstance(dataset, dict) else compact_dashboard_data(dataset, max_points)
+                for dataset in value
+            ]
+        else:
+            compacted[key] = compact_dashboard_data(value, max_points)
+    return compacted
+
+def compact_dashboard_data(data: Any, max_points: int = SUMMARY_MAX_SERIES_POINTS) -> Any:
+    """Strip chart styling, round numbers and shorten long lists before prompting.
+
+    Time and numeric series are sampled evenly, rankings are cut to their head.
+    """
+    if isinstance(data, dict):
+        if is_chart_data(data):
+            return compact_chart_data(data, max_points)
+        chart_config = is_chart_config(data)
+        return {
+            key: compact_dashboard_data(value, max_points)
+            for key, value in data.items()
+            if value is not None and not (chart_config and key in STYLE_KEYS)
+        }
+    if isinstance(data, list):
+        shortened = shorten(data, max_points, is_ordered_series(data))
+        return [compact_dashboard_data(value, max_points) for value in shortened]
+    if isinstance(data, float):
+        return round_number(data)
+    return data
@@ -0,0 +1,138 @@
+from langchain_core.embeddings import Embeddings
+from typing import Any, Dict, List, Optional
+import numpy as np
+import asyncio
+import hashlib
+import sqlite3
+import threading
+import os
+
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "embedding_cache.sqlite3")
+# Vectors kept on disk; the oldest written are dropped beyond it (about 12 KB each at 3072 dimensions)
+EMBEDDING_CACHE_MAX_ROWS = int(os.getenv("EMBEDDING_CACHE_MAX_ROWS", "200000"))
+
+class EmbeddingCache:
+    """Vectors on disk in SQLite, keyed by hash(model, dimensions, text).
+
+    Holds at most max_rows vectors, evicting the oldest written first.
+    """
+
+    def __init__(self, path: str = EMBEDDING_CACHE_PATH, max_rows: int = EMBEDDING_CACHE_MAX_ROWS):
+        self.path = path
+        self.max_rows = max_rows
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        # Readers (the API) and the index builder can use the file at the same time
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+        self.connection.commit()
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+
+    @staticmethod
+    def key(model: str, dimensions: Optional[int], text: str) -> str:
+        return hashlib.sha256(f"{model}\0{dimensions}\0{text}".encode()).hexdigest()
+
+    def get_many(self, keys: List[str]) -> Dict[str, List[float]]:
+        found = {}
+        with self.lock:
+            # Stay under SQLite's bound parameter limit
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                rows = self.connection.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({', '.join('?' * len(chunk))})", chunk
+                ).fetchall()
+                found.update((key, np.frombuffer(vector, dtype=np.float32).tolist()) for key, vector in rows)
+        return found
+
+    def put_many(self, items: Dict[str, List[float]]):
+        with self.lock:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                [(key, np.asarray(vector, dtype=np.float32).tobytes()) for key, vector in items.items()]
+            )
+            # Rowids grow with every write, replacements included, so the lowest are the oldest
+            self.evicted += self.connection.execute(
+                "DELETE FROM embeddings WHERE rowid <= (SELECT MAX(rowid) FROM embeddings) - ?", (self.max_rows,)
+            ).rowcount
+            self.connection.commit()
+
+    def record(self, hits: int, misses: int):
+        # Lookups run in worker threads
+        with self.lock:
+            self.hits += hits
+            self.misses += misses
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            entries = self.connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            hits, misses, evicted = self.hits, self.misses, self.evicted
+        lookups = hits + misses
+        return {
+            "enabled": True,
+            "entries": entries,
+            "maxEntries": self.max_rows,
+            "evicted": evicted,
+            "hits": hits,
+            "misses": misses,
+            "hitRate": round(hits / lookups, 3) if lookups else 0.0
+        }
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings that are looked up in the cache first.
+
+    Only texts missing from the cache are sent to the wrapped model, each
+    distinct text once, so duplicates within a call cost one embedding.
+    """
+
+    def __init__(self, embeddings: Embeddings, model: str, cache: EmbeddingCache):
+        self.embeddings = embeddings
+        self.model = model
+        self.dimensions = getattr(embeddings, "dimensions", None) or getattr(embeddings, "dims", None)
+        self.cache = cache
+
+    def lookup(self, texts: List[str]):
+        keys = [EmbeddingCache.key(self.model, self.dimensions, text) for text in texts]
+        found = self.cache.get_many(list(set(keys)))
+        missing = list({text: None for text, key in zip(texts, keys) if key not in found})
+        hits = sum(1 for key in keys if key in found)
+        self.cache.record(hits, len(keys) - hits)
+        return keys, found, missing
+
+    def store(self, keys: List[str], found: Dict[str, List[float]], missing: List[str], vectors: List[List[float]]):
+        new = {EmbeddingCache.key(self.model, self.dimensions, text): vector for text, vector in zip(missing, vectors)}
+        if new:
+            self.cache.put_many(new)
+        found.update(new)
+        return [found[key] for key in keys]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, found, missing = self.lookup(texts)
+        vectors = self.embeddings.embed_documents(missing) if missing else []
+        return self.store(keys, found, missing, vectors)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, found, missing = await asyncio.to_thread(self.lookup, texts)
+        vectors = await self.embeddings.aembed_documents(missing) if missing else []
+        return await asyncio.to_thread(self.store, keys, found, missing, vectors)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+_embedding_cache = None
+_embedding_cache_lock = threading.Lock()
+
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    """Process-wide embedding cache, or None when disabled"""
+    global _embedding_cache
+    if not EMBEDDING_CACHE_ENABLED:
+        return None
+    with _embedding_cache_lock:
+        if _embedding_cache is None:
+            _embedding_cache = EmbeddingCache()
+        return _embedding_cache
@@ -0,0 +1,148 @@
+from langchain_core.embeddings import Embeddings
+from openai import APIConnectionError, APITimeoutError, InternalServerError, RateLimitError
+from typing import Callable, List, Optional
+import numpy as np
+import asyncio
+import hashlib
+import random
+import shutil
+import json
+import os
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "200"))
+# Batches in flight at once; keep under the account's requests-per-minute limit
+EMBEDDING_CONCURRENCY = int(os.getenv("EMBEDDING_CONCURRENCY", "4"))
+EMBEDDING_MAX_RETRIES = int(os.getenv("EMBEDDING_MAX_RETRIES", "6"))
+EMBEDDING_BACKOFF_BASE = float(os.getenv("EMBEDDING_BACKOFF_BASE", "1"))
+EMBEDDING_BACKOFF_MAX = float(os.getenv("EMBEDDING_BACKOFF_MAX", "60"))
+EMBEDDING_CHECKPOINT_DIR = os.getenv("EMBEDDING_CHECKPOINT_DIR", "vector_db_checkpoint")
+
+RETRYABLE_ERRORS = (RateLimitError, APITimeoutError, APIConnectionError, InternalServerError)
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """Delay the API asked for in its Retry-After header, if any"""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+class EmbeddingPipeline:
+    """Embed many texts in concurrent batches, resumably.
+
+    Batches run at most `concurrency` at a time. A rate limit pauses every
+    worker until the Retry-After delay (or an exponential backoff with
+    jitter) has passed. Each finished batch is saved under
+    `checkpoint_dir`, so a rerun over the same texts only embeds the
+    batches that were missing.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        model: str,
+        batch_size: int = EMBEDDING_BATCH_SIZE,
+        concurrency: int = EMBEDDING_CONCURRENCY,
+        max_retries: int = EMBEDDING_MAX_RETRIES,
+        checkpoint_dir: Optional[str] = EMBEDDING_CHECKPOINT_DIR
+    ):
+        self.embeddings = embeddings
+        self.model = model
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.checkpoint_dir = checkpoint_dir
+        # Shared by all workers, so one rate limit slows the whole pipeline
+        self.paused_until = 0.0
+        self.retries = 0
+
+    def fingerprint(self, texts: List[str]) -> str:
+        digest = hashlib.sha256(f"{self.model}\0{self.batch_size}".encode())
+        for text in texts:
+            digest.update(b"\0" + text.encode())
+        return digest.hexdigest()
+
+    def batch_path(self, number: int) -> str:
+        return os.path.join(self.checkpoint_dir, f"batch_{number:06d}.npy")
+
+    def open_checkpoint(self, texts: List[str]):
+        """Keep checkpoints of the same texts, discard those of another build"""
+        if not self.checkpoint_dir:
+            return
+        manifest_path = os.path.join(self.checkpoint_dir, "manifest.json")
+        fingerprint = self.fingerprint(texts)
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                if json.load(f).get("fingerprint") == fingerprint:
+                    return
+            logger.warning("Discarding embedding checkpoints of a different build")
+            shutil.rmtree(self.checkpoint_dir)
+        os.makedirs(self.checkpoint_dir, exist_ok=True)
+        with open(manifest_path, "w") as f:
+            json.dump({"model": self.model, "batchSize": self.batch_size, "texts": len(texts), "fingerprint": fingerprint}, f)
+
+    def load_batch(self, number: int) -> Optional[np.ndarray]:
+        if self.checkpoint_dir and os.path.exists(self.batch_path(number)):
+            return np.load(self.batch_path(number))
+        return None
+
+    def save_batch(self, number: int, vectors: np.ndarray):
+        if not self.checkpoint_dir:
+            return
+        # Written under another name first, so a crash never leaves a partial batch
+        partial = self.batch_path(number) + ".partial.npy"
+        np.save(partial, vectors)
+        os.replace(partial, self.batch_path(number))
+
+    def clear_checkpoint(self):
+        if self.checkpoint_dir and os.path.exists(self.checkpoint_dir):
+            shutil.rmtree(self.checkpoint_dir)
+
+    async def embed_with_retry(self, texts: List[str]) -> np.ndarray:
+        for attempt in range(self.max_retries + 1):
+            wait = self.paused_until - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            try:
+                return np.asarray(await self.embeddings.aembed_documents(texts), dtype=np.float32)
+            except RETRYABLE_ERRORS as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = retry_after_seconds(e) or min(EMBEDDING_BACKOFF_BASE * 2 ** attempt, EMBEDDING_BACKOFF_MAX)
+                delay *= 1 + random.random() * 0.25
+                self.paused_until = max(self.paused_until, time.monotonic() + delay)
+                self.retries += 1
+                logger.warning(f"Embedding batch failed ({type(e).__name__}), retrying in {delay:.1f}s")
+
+    async def embed(self, texts: List[str], on_batch: Optional[Callable[[int], None]] = None) -> np.ndarray:
+        """Vectors of all texts, one float32 row per text in input order.
+
+        on_batch is called with the size of every batch as it finishes,
+        including batches restored from the checkpoint.
+        """
+        self.open_checkpoint(texts)
+        starts = list(range(0, len(texts), self.batch_size))
+        semaphore = asyncio.Semaphore(self.concurrency)
+        # Allocated once the first batch tells the dimension; batches fill their own rows
+        matrix: Optional[np.ndarray] = None
+
+        async def run(number: int, start: int):
+            nonlocal matrix
+            batch = texts[start:start + self.batch_size]
+            vectors = self.load_batch(number)
+            if vectors is None:
+                async with semaphore:
+                    vectors = await self.embed_with_retry(batch)
+                self.save_batch(number, vectors)
+            if matrix is None:
+                matrix = np.zeros((len(texts), vectors.shape[1]), dtype=np.float32)
+            matrix[start:start + len(batch)] = vectors
+            if on_batch:
+                on_batch(len(batch))
+
+        await asyncio.gather(*(run(number, start) for number, start in enumerate(starts)))
+        return matrix if matrix is not None else np.zeros((0, 0), dtype=np.float32)
@@ -3,15 +3,20 @@ from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain_community.vectorstores import FAISS
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_core.documents import Document
-from langchain_openai import OpenAIEmbeddings
-from uuid import uuid4
+from tools.model_providers import get_embeddings, EMBEDDING_PROVIDER
+from tools.embedding_pipeline import EmbeddingPipeline
+from typing import Dict, List, Optional, Tuple
 from tqdm import tqdm
+import numpy as np
 import tiktoken
+import hashlib
+import json
 
 from dotenv import load_dotenv
 import os
 from db.database import engine, get_db_session, DATABASE_URL
 from sqlalchemy import text
+import asyncio
 import logging
 
 # Set logging level for all loggers
@@ -23,6 +28,20 @@ logger.setLevel(logging.ERROR)
 
 load_dotenv()
 
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-large")
+
+# Metadata field holding each source row's primary key, and the file tracking indexed rows
+SOURCE_KEYS = {
+    "product_catalog": "product_id",
+    "reviewed_product": "review_id",
+    "social_media": "post_id",
+    "sentiment_social_media": "post_id"
+}
+MANIFEST_FILE = "sources.json"
+
+class VectorStoreMismatch(ValueError):
+    """A saved vector store was built with other embeddings than the configured ones"""
+
 if not os.environ.get("LANGSMITH_API_KEY"):
     os.environ["LANGSMITH_API_KEY"] = os.getenv("LANGSMITH_API_KEY")
     os.environ["LANGSMITH_TRACING"] = os.getenv("LANGSMITH_TRACING")
@@ -161,94 +180,251 @@ def split_and_tokenizer(documents):
     if truncated_count > 0:
         print(f"! {truncated_count:,} texts were truncated to {max_tokens:,} tokens")
     
-    return split_docs, tokenizer
+    return split_docs, total_tokens
+
+def record_key(metadata: dict) -> str:
+    """Source row of a document or chunk, as source:primary key"""
+    source = metadata["source"]
+    return f"{source}:{metadata[SOURCE_KEYS[source]]}"
+
+def content_id(text: str) -> int:
+    """Stable non-negative int64 id of a chunk text; identical texts share one vector"""
+    digest = hashlib.blake2b(text.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "little") >> 1
+
+def content_hash(doc: Document) -> str:
+    return hashlib.md5(doc.page_content.encode()).hexdigest()
 
-def process_batch(batch_docs):
-    """Process a batch of documents"""
-    texts = [doc.page_content for doc in batch_docs]
-    metadatas = [doc.metadata for doc in batch_docs]
-    batch_tokens = sum(len(tokenizer.encode(text)) for text in texts)
+def merged_document(text: str, records: List[dict]) -> Document:
+    """Docstore entry of one vector; every record sharing its text is listed under records"""
+    metadata = dict(records[0])
+    if len(records) > 1:
+        metadata["records"] = records
+    return Document(page_content=text, metadata=metadata)
+
+def document_records(doc: Document) -> List[dict]:
+    if "records" in doc.metadata:
+        return list(doc.metadata["records"])
+    return [doc.metadata]
+
+def chunk_documents(documents: List[Document]) -> Tuple[Dict[int, Tuple[str, List[dict]]], Dict[str, dict]]:
+    """Split documents and group the chunks by text.
+
+    Returns {content id: (text, chunk metadata of every record with that
+    text)} and the manifest entry ({"hash", "ids"}) of every source row.
+    """
+    rows = {}
+    for doc in documents:
+        rows[record_key(doc.metadata)] = {"hash": content_hash(doc), "ids": []}
+
+    split_docs, total_tokens = split_and_tokenizer(documents)
+    print(f"+ Total tokens: {total_tokens:,}")
+    chunks = {}
+    for doc in split_docs:
+        chunk_id = content_id(doc.page_content)
+        chunks.setdefault(chunk_id, (doc.page_content, []))[1].append(doc.metadata)
+        rows[record_key(doc.metadata)]["ids"].append(chunk_id)
+    print(f"+ {len(split_docs):,} chunks with {len(chunks):,} distinct texts")
+    return chunks, rows
+
+def embed_texts(texts: List[str], embeddings) -> np.ndarray:
+    print("\n=== Creating Embeddings ===")
+    pipeline = EmbeddingPipeline(embeddings, EMBEDDING_MODEL)
+    total_batches = (len(texts) + pipeline.batch_size - 1) // pipeline.batch_size
+    print(f"* Processing {total_batches:,} batches (batch size: {pipeline.batch_size:,}, {pipeline.concurrency} at a time)")
     
-    vdb = FAISS(
+    # Initialize progress bar
+    pbar = tqdm(total=total_batches,
+                desc="Creating embeddings",
+                unit="batch",
+                bar_format="{l_bar}{bar}| {n_fmt}/{total_fmt} [{elapsed}<{remaining}, {rate_fmt}]")
+    
+    # Finished batches are checkpointed, a rerun after a crash resumes where it stopped
+    vectors = asyncio.run(pipeline.embed(texts, on_batch=lambda size: pbar.update(1)))
+    pbar.close()
+    pipeline.clear_checkpoint()
+    
+    if pipeline.retries:
+        print(f"! {pipeline.retries:,} batch requests were retried")
+    return vectors
+
+def source_watermarks(rows: Dict[str, dict]) -> Dict[str, int]:
+    watermarks = {}
+    for key in rows:
+        source, pk = key.rsplit(":", 1)
+        watermarks[source] = max(watermarks.get(source, 0), int(pk))
+    return watermarks
+
+def create_vector_db(documents=None):
+    """Build the vector store and its manifest from scratch.
+
+    Each distinct chunk text is embedded once and stored under an id
+    derived from the text, so update_vector_db can later replace or
+    remove the vectors of a row.
+    """
+    if documents is None:
+        print("\n=== Loading Documents ===")
+        documents = extract_document()
+    print(f"+ Found {len(documents):,} documents")
+    
+    embeddings = get_embeddings(EMBEDDING_MODEL)
+    chunks, rows = chunk_documents(documents)
+    ids = list(chunks)
+    vectors = embed_texts([chunks[i][0] for i in ids], embeddings)
+    
+    # One index, filled in a single add instead of one store per batch merged together
+    index = faiss.IndexIDMap2(faiss.IndexFlatL2(vectors.shape[1]))
+    index.add_with_ids(vectors, np.array(ids, dtype=np.int64))
+    vector_store = FAISS(
         embedding_function=embeddings,
-        index=faiss.IndexFlatL2(dimension),
-        docstore=InMemoryDocstore(),
-        index_to_docstore_id={}
+        index=index,
+        docstore=InMemoryDocstore({str(i): merged_document(*chunks[i]) for i in ids}),
+        # Searches return the vector ids, which are also the docstore ids
+        index_to_docstore_id={i: str(i) for i in ids}
     )
+    manifest = {
+        "provider": EMBEDDING_PROVIDER,
+        "model": EMBEDDING_MODEL,
+        "dimension": int(index.d),
+        "watermarks": source_watermarks(rows),
+        "rows": rows
+    }
     
-    return vdb.from_texts(
-        texts=texts,
-        embedding=embeddings,
-        metadatas=metadatas
-    ), batch_tokens
+    print(f"\n+ Vector store creation completed!")
+    return vector_store, manifest
+
+def update_vector_db(path: str = "vector_db"):
+    """Bring a saved vector store up to date with Postgres.
 
-def create_vector_db(documents):
+    Rows above a source's watermark are new, rows whose text hash changed
+    are re-chunked, and rows gone from Postgres (or no longer Active
+    products) are removed. The source tables have no update timestamps,
+    so every row's text is read, but only chunk texts not yet in the index
+    are embedded. A vector is dropped once no row references it.
+    Stores without a manifest, or built with another provider, model or
+    dimension, are rebuilt.
+    """
+    manifest = load_manifest(path)
+    vector_store = None
+    if manifest is None or "provider" not in manifest:
+        print("! No manifest recording the embedding provider, rebuilding the vector store")
+    else:
+        try:
+            vector_store = load_vector_db(path)
+        except VectorStoreMismatch as e:
+            print(f"! {e}, rebuilding the vector store")
+    if vector_store is None:
+        vector_store, manifest = create_vector_db()
+        save_vector_db(vector_store, path, manifest)
+        return vector_store
     
     print("\n=== Loading Documents ===")
     documents = extract_document()
-    print(f"+ Found {len(documents):,} documents")
+    if not documents:
+        # An empty extract is far more likely a failed query than an emptied database
+        print("! No documents extracted, keeping the vector store as is")
+        return vector_store
     
-    split_docs, tokenizer = split_and_tokenizer(documents)
+    current = {record_key(doc.metadata): doc for doc in documents}
+    rows = manifest["rows"]
+    watermarks = manifest["watermarks"]
     
-    print("\n=== Creating Embeddings ===")
-    dimension = 3072
-    embeddings = OpenAIEmbeddings(model="text-embedding-3-large")
+    new_keys = [key for key in current if key not in rows]
+    changed_keys = [key for key in current if key in rows and rows[key]["hash"] != content_hash(current[key])]
+    deleted_keys = [key for key in rows if key not in current]
+    above_watermark = sum(1 for key in new_keys if int(key.rsplit(":", 1)[1]) > watermarks.get(key.rsplit(":", 1)[0], 0))
+    print(f"+ {len(new_keys):,} new rows ({above_watermark:,} above the watermarks), {len(changed_keys):,} changed, {len(deleted_keys):,} deleted")
     
-    # Process in batches for better performance
-    batch_size = 200
-    total_batches = (len(split_docs) + batch_size - 1) // batch_size
-    print(f"* Processing {total_batches:,} batches (batch size: {batch_size:,})")
+    # Records of every vector touched by the update, as they will be afterwards
+    texts: Dict[int, str] = {}
+    records: Dict[int, List[dict]] = {}
     
-    # Initialize progress bar
-    pbar = tqdm(total=total_batches,
-                desc="Creating embeddings",
-                unit="batch",
-                bar_format="{l_bar}{bar}| {n_fmt}/{total_fmt} [{elapsed}<{remaining}, {rate_fmt}]")
+    def existing(chunk_id: int):
+        if chunk_id not in records:
+            doc = vector_store.docstore.search(str(chunk_id)) if chunk_id in vector_store.index_to_docstore_id else None
+            texts[chunk_id] = doc.page_content if doc else None
+            records[chunk_id] = document_records(doc) if doc else []
     
-    # Process all batches
-    vector_store = None
-    total_processed_tokens = 0
+    for key in changed_keys + deleted_keys:
+        for chunk_id in set(rows.pop(key)["ids"]):
+            existing(chunk_id)
+            records[chunk_id] = [record for record in records[chunk_id] if record_key(record) != key]
     
-    for i in range(0, len(split_docs), batch_size):
-        batch = split_docs[i:i+batch_size]
-        
-        if vector_store is None:
-            # First batch initializes the vector store
-            vector_store, batch_tokens = process_batch(batch)
-        else:
-            # Subsequent batches are merged
-            new_vectorstore, batch_tokens = process_batch(batch)
-            vector_store.merge_from(new_vectorstore)
-        
-        # Update progress
-        total_processed_tokens += batch_tokens
-        pbar.update(1)
-        pbar.set_postfix({
-            "tokens_processed": f"{total_processed_tokens:,}",
-            "avg_tokens/batch": f"{total_processed_tokens/(pbar.n):,.0f}"
-        })
+    upserts = [current[key] for key in new_keys + changed_keys]
+    if upserts:
+        chunks, upserted_rows = chunk_documents(upserts)
+        for chunk_id, (text, chunk_records) in chunks.items():
+            existing(chunk_id)
+            texts[chunk_id] = text
+            records[chunk_id] += chunk_records
+        rows.update(upserted_rows)
     
-    print(f"\n+ Vector store creation completed!")
-    print(f"+ Total tokens processed: {total_processed_tokens:,}")
-    print(f"+ Average tokens per batch: {total_processed_tokens/total_batches:,.0f}")
+    indexed = vector_store.index_to_docstore_id
+    removed = [i for i in records if not records[i] and i in indexed]
+    updated = [i for i in records if records[i] and i in indexed]
+    added = [i for i in records if records[i] and i not in indexed]
+    print(f"+ {len(added):,} vectors to embed, {len(updated):,} to relabel, {len(removed):,} to remove")
+    
+    if removed or updated:
+        vector_store.docstore.delete([str(i) for i in removed + updated])
+    if removed:
+        vector_store.index.remove_ids(np.array(removed, dtype=np.int64))
+        for i in removed:
+            del indexed[i]
+    if added:
+        vectors = embed_texts([texts[i] for i in added], vector_store.embeddings)
+        vector_store.index.add_with_ids(vectors, np.array(added, dtype=np.int64))
+        indexed.update({i: str(i) for i in added})
+    if updated or added:
+        vector_store.docstore.add({str(i): merged_document(texts[i], records[i]) for i in updated + added})
     
+    for source, watermark in source_watermarks(rows).items():
+        watermarks[source] = max(watermarks.get(source, 0), watermark)
+    save_vector_db(vector_store, path, manifest)
     return vector_store
 
-def save_vector_db(vector_store: FAISS, path: str = "vector_db"):
+def load_manifest(path: str = "vector_db") -> Optional[dict]:
+    manifest_path = os.path.join(path, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path) as f:
+        return json.load(f)
+
+def save_vector_db(vector_store: FAISS, path: str = "vector_db", manifest: Optional[dict] = None):
     print(f"\n=== Saving Vector Store ===")
     vector_store.save_local(path)
+    if manifest is not None:
+        with open(os.path.join(path, MANIFEST_FILE), "w") as f:
+            json.dump(manifest, f)
     print("Vector store saved successfully")
     
+def check_manifest(manifest: dict, dimension: int):
+    """Raise VectorStoreMismatch unless the store matches the configured embeddings.
+
+    Manifests written before the provider was recorded are only checked on
+    model and dimension.
+    """
+    built = f"{manifest.get('provider', EMBEDDING_PROVIDER)}:{manifest.get('model')}"
+    configured = f"{EMBEDDING_PROVIDER}:{EMBEDDING_MODEL}"
+    if built != configured:
+        raise VectorStoreMismatch(f"Vector store was built with {built} embeddings, {configured} is configured")
+    if manifest.get("dimension", dimension) != dimension:
+        raise VectorStoreMismatch(f"Vector store index has {dimension} dimensions, its manifest {manifest['dimension']}")
+
 def load_vector_db(path: str = "vector_db"):
     
     print(f"=== Loading Vector Store ===")
-    embeddings = OpenAIEmbeddings(model="text-embedding-3-large")
+    embeddings = get_embeddings(EMBEDDING_MODEL)
     
     vector_store = FAISS.load_local(
         folder_path=path,
         embeddings=embeddings,
         allow_dangerous_deserialization=True  # Safe because we created this file
     )
+    # Query vectors of other embeddings would search the index without any error
+    manifest = load_manifest(path)
+    if manifest is not None:
+        check_manifest(manifest, vector_store.index.d)
     print("Vector store loaded successfully\n")
     return vector_store
 
@@ -258,7 +434,8 @@ if __name__ == "__main__":
     vector_store_path = "vector_db"
     
     if os.path.exists(vector_store_path):
-        vector_store = load_vector_db(vector_store_path)
+        # Embeds only the rows added or changed since the last run
+        vector_store = update_vector_db(vector_store_path)
         
         results = vector_store.similarity_search(
             "Blue Casual Nike Sandals",
@@ -273,9 +450,9 @@ if __name__ == "__main__":
         
         if(documents is not None):
             print("==== Initializing Vector DB ====")
-            vector_store = create_vector_db(documents)
+            vector_store, manifest = create_vector_db(documents)
             print("vector_store: ", vector_store)
             
             print("==== Saving Vector DB ====")
             if(vector_store is not None):
-                save_vector_db(vector_store, vector_store_path)
\ No newline at end of file
+                save_vector_db(vector_store, vector_store_path, manifest)
@@ -0,0 +1,94 @@
+from langchain_core.messages import BaseMessage, HumanMessage, ToolMessage
+from typing import Any, Dict, List
+import tiktoken
+import json
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Exchanges (a question and everything up to its answer) the model always sees verbatim
+HISTORY_KEEP_EXCHANGES = int(os.getenv("HISTORY_KEEP_EXCHANGES", "3"))
+HISTORY_TOOL_SUMMARY_CHARS = int(os.getenv("HISTORY_TOOL_SUMMARY_CHARS", "200"))
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "6000"))
+
+# Only loaded encodings are cached, so a failed download is retried on the next turn
+ENCODINGS: Dict[str, Any] = {}
+
+def get_encoding(model_name: str):
+    """tiktoken encoding of the model, or None when it cannot be loaded (e.g. offline)"""
+    if model_name in ENCODINGS:
+        return ENCODINGS[model_name]
+    try:
+        try:
+            encoding = tiktoken.encoding_for_model(model_name)
+        except KeyError:
+            encoding = tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        logger.error(f"tiktoken encoding unavailable, estimating tokens from length: {str(e)}")
+        return None
+    ENCODINGS[model_name] = encoding
+    return encoding
+
+def text_tokens(text: str, encoding) -> int:
+    return len(encoding.encode(text)) if encoding is not None else len(text) // 4 + 1
+
+def count_tokens(messages: List[BaseMessage], encoding) -> int:
+    total = 0
+    for message in messages:
+        content = message.content if isinstance(message.content, str) else json.dumps(message.content)
+        total += text_tokens(content, encoding) + 4
+        for tool_call in getattr(message, "tool_calls", None) or []:
+            total += text_tokens(json.dumps(tool_call.get("args", {}), default=str), encoding)
+    return total
+
+def summarize_tool_output(message: ToolMessage, max_chars: int = HISTORY_TOOL_SUMMARY_CHARS) -> ToolMessage:
+    """Shorten an old tool result to its head and a note of what was cut"""
+    content = message.content if isinstance(message.content, str) else json.dumps(message.content)
+    if len(content) <= max_chars:
+        return message
+    note = f"[earlier {message.name or 'tool'} output shortened from {len(content):,} characters"
+    if content.startswith("[("):
+        note += f", about {content.count('), (') + 1:,} rows"
+    return message.model_copy(update={"content": f"{content[:max_chars]}... {note}]"})
+
+def split_exchanges(messages: List[BaseMessage]) -> List[List[BaseMessage]]:
+    exchanges = []
+    for message in messages:
+        if isinstance(message, HumanMessage) or not exchanges:
+            exchanges.append([])
+        exchanges[-1].append(message)
+    return exchanges
+
+def compact_history(
+    messages: List[BaseMessage],
+    encoding,
+    keep_exchanges: int = HISTORY_KEEP_EXCHANGES,
+    token_budget: int = HISTORY_TOKEN_BUDGET
+) -> List[BaseMessage]:
+    """Messages the model sees for this step.
+
+    The latest exchanges are kept verbatim, tool outputs of older ones are
+    shortened, and whole exchanges are dropped oldest first until the
+    history fits the token budget. The current exchange is always kept.
+    """
+    exchanges = split_exchanges(messages)
+    cut = max(len(exchanges) - keep_exchanges, 0)
+    exchanges = [
+        [summarize_tool_output(m) if isinstance(m, ToolMessage) else m for m in exchange]
+        for exchange in exchanges[:cut]
+    ] + exchanges[cut:]
+
+    sizes = [count_tokens(exchange, encoding) for exchange in exchanges]
+    total = sum(sizes)
+    while len(exchanges) > 1 and total > token_budget:
+        total -= sizes.pop(0)
+        exchanges.pop(0)
+    return [message for exchange in exchanges for message in exchange]
+
+def make_history_hook(model_name: str):
+    """pre_model_hook for create_react_agent; the stored history is left untouched"""
+    def compact_history_hook(state: Dict[str, Any]) -> Dict[str, Any]:
+        return {"llm_input_messages": compact_history(state["messages"], get_encoding(model_name))}
+
+    return compact_history_hook
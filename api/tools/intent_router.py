@@ -0,0 +1,220 @@
+from sqlalchemy import text
+from datetime import date
+from typing import Any, Dict, List, Optional, Tuple
+import re
+import os
+import time
+
+INTENT_ROUTER_ENABLED = os.getenv("INTENT_ROUTER_ENABLED", "true").lower() == "true"
+BRAND_LIST_TTL = int(os.getenv("BRAND_LIST_TTL", "600"))
+
+# Questions asking for more than a lookup go to the agent even when an intent matches:
+# analysis, rankings, groupings and filters the templates do not apply
+COMPLEX_PATTERN = re.compile(
+    r"\b(bandingkan|dibandingkan|banding|compare|comparison|versus|vs|kenapa|mengapa|why|how come|"
+    r"tren|trend|per bulan|per minggu|bulanan|mingguan|monthly|weekly|rekomendasi|recommend\w*|strategi|strategy|prediksi|predict\w*|"
+    r"highest|lowest|tertinggi|terendah|terbanyak|tersedikit|most|least|paling(?! laris)|best(?![- ]selling)|worst|terbaik|terburuk|"
+    r"per|by|berdasarkan|(?:which|what|mana) (?:\w+ )*?(?:has|had|memiliki|punya)|"
+    r"platform\w*|channel|payment|pembayaran|credit card|debit|cash|kartu kredit|transactions?|transaksi|"
+    r"comments?|komentar|social media|media sosial|instagram|tiktok|twitter|facebook|youtube|"
+    r"location|lokasi|city|kota|gender|age|usia|umur)\b"
+)
+# A brand listing question may only contain these words besides "brand"
+BRAND_LIST_WORDS = {
+    "what", "which", "are", "is", "the", "all", "list", "show", "me", "there", "do", "you", "have", "in",
+    "database", "data", "available", "exist", "of", "your", "our", "my",
+    "apa", "saja", "aja", "ada", "yang", "di", "daftar", "semua", "tersedia", "sebutkan", "tampilkan"
+}
+INDONESIAN_WORDS = {"apa", "saja", "berapa", "yang", "di", "ada", "penjualan", "produk", "sentimen", "terlaris", "bagaimana", "untuk", "dari", "tahun", "kuartal"}
+
+QUARTER_PATTERN = re.compile(r"\b(?:q|kuartal\s*|quarter\s*)([1-4])\b")
+YEAR_PATTERN = re.compile(r"\b(20\d{2})\b")
+TOP_N_PATTERN = re.compile(r"\b(?:top|teratas|terlaris)\s*(\d{1,2})\b|\b(\d{1,2})\s*(?:produk|products?)\b")
+
+def format_rupiah(value: float) -> str:
+    return "Rp" + f"{value:,.0f}".replace(",", ".")
+
+def format_number(value: float) -> str:
+    return f"{value:,.0f}".replace(",", ".")
+
+def quarter_bounds(quarter: int, year: int) -> Tuple[date, date]:
+    start = date(year, 3 * quarter - 2, 1)
+    end = date(year + 1, 1, 1) if quarter == 4 else date(year, 3 * quarter + 1, 1)
+    return start, end
+
+class IntentRouter:
+    """Keyword intent classifier answering the most common chat questions from SQL templates.
+
+    Each intent needs its keywords and every slot it uses (brand, period);
+    anything else, or anything that looks like analysis, returns None and
+    is left to the agent.
+    """
+
+    def __init__(self):
+        self.brands: List[str] = []
+        self.brands_loaded_at = 0.0
+        self.hits: Dict[str, int] = {}
+        self.fallthrough = 0
+
+    def known_brands(self, connection) -> List[str]:
+        if time.time() - self.brands_loaded_at > BRAND_LIST_TTL:
+            self.brands = [row[0] for row in connection.execute(text(
+                "SELECT DISTINCT brand FROM product_catalog WHERE brand IS NOT NULL ORDER BY brand"
+            ))]
+            self.brands_loaded_at = time.time()
+        return self.brands
+
+    def find_brand(self, question: str, connection) -> Optional[str]:
+        for brand in self.known_brands(connection):
+            if re.search(rf"\b{re.escape(brand.lower())}\b", question):
+                return brand
+        return None
+
+    def find_period(self, question: str, connection) -> Optional[Tuple[date, date, str]]:
+        quarter = QUARTER_PATTERN.search(question)
+        year = YEAR_PATTERN.search(question)
+        if quarter:
+            if year:
+                year_value = int(year.group(1))
+            else:
+                # Without a year, the quarter of the latest year with sales
+                latest = connection.execute(text("SELECT MAX(day) FROM sales_daily_rollup")).scalar()
+                year_value = latest.year if latest else date.today().year
+            start, end = quarter_bounds(int(quarter.group(1)), year_value)
+            return start, end, f"Q{quarter.group(1)} {year_value}"
+        if year:
+            year_value = int(year.group(1))
+            return date(year_value, 1, 1), date(year_value + 1, 1, 1), str(year_value)
+        return None
+
+    def list_brands(self, question, connection, indonesian) -> Optional[str]:
+        # Only a pure listing question; "which brand has the most ..." is a ranking
+        words = re.findall(r"\w+", question)
+        brand_words = {"brand", "brands", "merek", "merk"}
+        if not brand_words & set(words) or not set(words) <= BRAND_LIST_WORDS | brand_words:
+            return None
+        if not re.search(r"\b(apa saja|apa aja|daftar|list|which|what|semua|all|sebutkan|tampilkan)\b", question):
+            return None
+        brands = self.known_brands(connection)
+        if indonesian:
+            return f"Terdapat {len(brands)} brand di database: {', '.join(brands)}."
+        return f"There are {len(brands)} brands in the database: {', '.join(brands)}."
+
+    def sales_in_period(self, question, connection, indonesian) -> Optional[str]:
+        if not re.search(r"\b(penjualan|penjualanku|sales|omzet|omset|pendapatan|revenue)\b", question):
+            return None
+        period = self.find_period(question, connection)
+        if period is None:
+            return None
+        start, end, label = period
+        brand = self.find_brand(question, connection)
+        row = connection.execute(text("""
+            SELECT COALESCE(SUM(order_value), 0) AS total, COUNT(DISTINCT day) AS days
+            FROM sales_daily_rollup
+            WHERE day >= :start AND day < :end
+              AND (CAST(:brand AS VARCHAR) IS NULL OR brand = :brand)
+        """), {"start": start, "end": end, "brand": brand}).one()
+        subject = f" {brand}" if brand else ""
+        if not row.days:
+            if indonesian:
+                return f"Tidak ada data penjualan{subject} untuk periode {label}."
+            return f"There are no{subject} sales recorded for {label}."
+        average = row.total / row.days
+        if indonesian:
+            return (
+                f"Total penjualan{subject} pada {label} adalah {format_rupiah(row.total)}, "
+                f"dengan rata-rata harian {format_rupiah(average)} selama {row.days} hari yang memiliki transaksi."
+            )
+        return (
+            f"Total{subject} sales in {label} were {format_rupiah(row.total)}, "
+            f"a daily average of {format_rupiah(average)} over {row.days} days with transactions."
+        )
+
+    def top_products(self, question, connection, indonesian) -> Optional[str]:
+        if not re.search(r"\b(terlaris|paling laris|best[- ]selling|top products?|top \d+ products?|produk teratas)\b", question):
+            return None
+        match = TOP_N_PATTERN.search(question)
+        limit = min(int(next(g for g in match.groups() if g)), 20) if match else 5
+        brand = self.find_brand(question, connection)
+        period = self.find_period(question, connection)
+        start, end, label = period if period else (None, None, None)
+        rows = connection.execute(text("""
+            SELECT pc.product_name, pc.brand, COUNT(*) AS units
+            FROM sale_product sp
+            JOIN product_catalog pc ON pc.product_id = sp.product_id
+            JOIN sales s ON s.transaction_id = sp.transaction_id
+            WHERE (CAST(:brand AS VARCHAR) IS NULL OR pc.brand = :brand)
+              AND (CAST(:start AS DATE) IS NULL OR (s.purchase_date >= :start AND s.purchase_date < :end))
+            GROUP BY pc.product_name, pc.brand
+            ORDER BY units DESC, pc.product_name
+            LIMIT :limit
+        """), {"brand": brand, "start": start, "end": end, "limit": limit}).all()
+        scope = " ".join(part for part in (brand, label) if part)
+        if not rows:
+            if indonesian:
+                return "Tidak ada data penjualan produk" + (f" untuk {scope}" if scope else "") + "."
+            return "No product sales found" + (f" for {scope}" if scope else "") + "."
+        unit = "unit" if indonesian else "units"
+        lines = [f"{i}. {row.product_name} ({row.brand}) - {format_number(row.units)} {unit}" for i, row in enumerate(rows, 1)]
+        if indonesian:
+            header = f"Berikut {len(rows)} produk terlaris" + (f" untuk {scope}" if scope else "") + ":"
+        else:
+            header = f"Here are the top {len(rows)} best-selling products" + (f" for {scope}" if scope else "") + ":"
+        return header + "\n" + "\n".join(lines)
+
+    def brand_sentiment(self, question, connection, indonesian) -> Optional[str]:
+        # Only product reviews; social media sentiment is left to the agent
+        if not re.search(r"\b(sentimen|sentiment)\b", question) or not re.search(
+            r"\b(reviews?|ulasan|review produk|product reviews?|rating|ratings)\b", question
+        ):
+            return None
+        brand = self.find_brand(question, connection)
+        if brand is None:
+            return None
+        row = connection.execute(text("""
+            SELECT COUNT(*) AS total,
+                   COUNT(*) FILTER (WHERE sentiment_score >= 0.5) AS positive,
+                   AVG(sentiment_score) AS average
+            FROM reviewed_product
+            WHERE brand = :brand
+        """), {"brand": brand}).one()
+        if not row.total:
+            return f"Belum ada ulasan untuk {brand}." if indonesian else f"There are no reviews for {brand} yet."
+        share = row.positive * 100.0 / row.total
+        # Same split as the review dashboard: positive from a score of 0.5, the rest below it
+        if indonesian:
+            return (
+                f"Dari {format_number(row.total)} ulasan produk {brand}, {share:.1f}% bersentimen positif "
+                f"(skor sentimen 0,5 atau lebih) dan {100 - share:.1f}% memiliki skor di bawah 0,5, "
+                f"dengan skor sentimen rata-rata {float(row.average):.2f}."
+            )
+        return (
+            f"Of {format_number(row.total)} {brand} product reviews, {share:.1f}% are positive "
+            f"(a sentiment score of 0.5 or more) and {100 - share:.1f}% score below 0.5, "
+            f"with an average sentiment score of {float(row.average):.2f}."
+        )
+
+    def route(self, question: str, engine) -> Optional[Tuple[str, str]]:
+        """Return (intent, answer) for a recognized question, or None to use the agent"""
+        normalized = re.sub(r"\s+", " ", question.lower()).strip()
+        if COMPLEX_PATTERN.search(normalized):
+            self.fallthrough += 1
+            return None
+        indonesian = bool(INDONESIAN_WORDS & set(re.findall(r"\w+", normalized)))
+        with engine.connect() as connection:
+            for intent in (self.sales_in_period, self.top_products, self.brand_sentiment, self.list_brands):
+                answer = intent(normalized, connection, indonesian)
+                if answer is not None:
+                    self.hits[intent.__name__] = self.hits.get(intent.__name__, 0) + 1
+                    return intent.__name__, answer
+        self.fallthrough += 1
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": INTENT_ROUTER_ENABLED,
+            "hits": dict(self.hits),
+            "fallthrough": self.fallthrough
+        }
+
+intent_router = IntentRouter()
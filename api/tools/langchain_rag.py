@@ -3,15 +3,27 @@ from langchain_community.utilities import SQLDatabase
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_community.tools.sql_database.tool import QuerySQLDatabaseTool
 from langchain_community.agent_toolkits import SQLDatabaseToolkit
-from langchain_core.messages import HumanMessage
+from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
 from langgraph.prebuilt import create_react_agent
 from langchain.agents.agent_toolkits import create_retriever_tool
-from langgraph.checkpoint.memory import MemorySaver
+from tools.checkpointer import get_checkpointer
+from tools.answer_cache import get_answer_cache
+from tools.sql_cache import with_cached_query_tool
+from tools.sql_guard import create_agent_database
+from tools.model_providers import get_chat_model
+from tools.intent_router import intent_router, INTENT_ROUTER_ENABLED
+from tools.history_hook import make_history_hook
+from tools.schema_selector import SchemaSelector
+from tools.telemetry import TurnTrace
 from typing_extensions import TypedDict, Annotated
 from dotenv import load_dotenv
 import os
 from db.database import DATABASE_URL
+from sqlalchemy import text
 import asyncio
+import hashlib
+import threading
+import time
 import uuid
 import logging
 import json
@@ -35,31 +47,82 @@ class QueryOutput(TypedDict):
     """Generated SQL query."""
     query: Annotated[str, ..., "Syntactically valid SQL query."]
 
-class LangChainRAG:
-    def __init__(self, vector_store=None, model_name="gpt-4o", temperature=0, streaming=True):
-        """
-        Initialize LangChainRAG with configuration
-        
-        Args:
-            vector_store: Pre-loaded vector store instance
-            model_name (str): Name of the OpenAI model to use
-            temperature (float): Temperature for model generation
-            streaming (bool): Whether to use streaming for model generation
-        """
+# Streamed tokens are coalesced into one SSE frame per window, or sooner when the buffer fills
+STREAM_FLUSH_INTERVAL = float(os.getenv("STREAM_FLUSH_INTERVAL_MS", "40")) / 1000
+STREAM_FLUSH_CHARS = int(os.getenv("STREAM_FLUSH_CHARS", "256"))
+
+def sse_frame(payload: dict) -> str:
+    return f"data: {json.dumps(payload)}\n\n"
+
+class TokenBatcher:
+    """Buffer streamed text and release it as SSE frames by time window and size"""
+
+    def __init__(self, interval: float = STREAM_FLUSH_INTERVAL, max_chars: int = STREAM_FLUSH_CHARS):
+        self.interval = interval
+        self.max_chars = max_chars
+        self.buffer = []
+        self.size = 0
+        self.flushed_at = time.monotonic()
+
+    def add(self, text: str):
+        """Buffer text, returns a frame when the window elapsed or the buffer is full"""
+        self.buffer.append(text)
+        self.size += len(text)
+        if self.size >= self.max_chars or time.monotonic() - self.flushed_at >= self.interval:
+            return self.flush()
+        return None
+
+    def flush(self):
+        self.flushed_at = time.monotonic()
+        if not self.buffer:
+            return None
+        frame = sse_frame({"text": "".join(self.buffer)})
+        self.buffer = []
+        self.size = 0
+        return frame
+
+# Replaced per turn by the tables relevant to the question
+TABLE_INFO_PLACEHOLDER = "<<table_info>>"
+
+# How often the background job checks whether the database schema changed
+SCHEMA_CHECK_INTERVAL = int(os.getenv("SCHEMA_CHECK_INTERVAL", "300"))
+
+def get_schema_version(engine) -> str:
+    """Hash of the public schema's tables and columns, cheap enough to poll"""
+    with engine.connect() as connection:
+        rows = connection.execute(text("""
+            SELECT table_name, column_name, data_type
+            FROM information_schema.columns
+            WHERE table_schema = 'public'
+            ORDER BY table_name, ordinal_position
+        """)).all()
+    return hashlib.md5(repr(rows).encode()).hexdigest()
+
+class SharedAgent:
+    """Process-wide SQL database, toolkit, cached table info and agent graph.
+
+    Chat sessions only differ by thread_id on the shared checkpointer, so this
+    is built once per process and rebuilt only when the schema version changes.
+    """
+
+    def __init__(self, vector_store=None, model_name="gpt-4o", temperature=0, streaming=True, checkpointer=None):
         load_dotenv()
-        self.memory = MemorySaver()
-        self.config = {"configurable": {"thread_id": str(uuid.uuid4())}}
         
         # Set environment variables
         if not os.environ.get("LANGSMITH_API_KEY"):
             os.environ["LANGSMITH_API_KEY"] = os.getenv("LANGSMITH_API_KEY")
             os.environ["LANGSMITH_TRACING"] = os.getenv("LANGSMITH_TRACING")
         
+        self.model_name = model_name
+        self.memory = checkpointer or get_checkpointer()
+        
         # Initialize components
-        self.db = SQLDatabase.from_uri(DATABASE_URL)
-        self.llm = ChatOpenAI(model=model_name, temperature=temperature, streaming=streaming, verbose=False)
+        self.db = create_agent_database()
+        self.schema_version = get_schema_version(self.db._engine)
+        self.schema = SchemaSelector(self.db)
+        self.llm = get_chat_model(model_name=model_name, temperature=temperature, streaming=streaming)
         self.toolkit = SQLDatabaseToolkit(db=self.db, llm=self.llm)
-        self.tools = self.toolkit.get_tools()
+        self.tools = with_cached_query_tool(self.toolkit.get_tools())
         
         # Set vector store and setup retriever if provided
         self.vector_store = vector_store
@@ -68,7 +131,7 @@ class LangChainRAG:
         
         # Setup agent
         self.setup_sql_agent()
-    
+
     def setup_retriever(self):
         """Setup vector store retriever and create retriever tool"""
         self.retriever = self.vector_store.as_retriever(search_kwargs={"k": 3})
@@ -98,9 +161,12 @@ class LangChainRAG:
 
                 DO NOT make any DML statements (INSERT, UPDATE, DELETE, DROP etc.) to the database.
 
-                To start you should ALWAYS look at the tables in the database to see what you can query.
-                Do NOT skip this step. Only use the following tables:
+                The tables relevant to the question are described below as table(column type, ...), where pk marks the primary key and -> a foreign key.
+                Query them directly. Only use the schema tool for a table that is not described here.
                 {table_info}
+
+                The daily views (brand_daily_sales, product_daily_sales, brand_daily_reviews, platform_daily_social) are small pre-aggregated summaries of the raw tables.
+                ALWAYS answer from them when they have the needed columns, aggregating their days with SUM or AVG; join the raw tables only for details the views do not have.
                 
                 Pay attention to use only the column names that you can see in the table schema. Be careful to not query for columns that do not exist. Also, pay attention to which column is in which table.
                 FOCUS only on insight that can be generated from the database. DO NOT answer questions that is not related to the database.
@@ -112,7 +178,7 @@ class LangChainRAG:
                 Guidlines for the query:
                     - if the question asks for statisctical calculation, ALWAYS use statistical functions (AVG, SUM, MIN, MAX, etc.)
                     - ALWAYS LIMIT your query to at most {top_k}
-                    - if the question ask for sentiment, you can join social_media with sentiment_social_media
+                    - if the question ask for sentiment, use brand_daily_reviews or platform_daily_social, or join social_media with sentiment_social_media for the comments themselves
                     - if the question asks about trends, ALWAYS answer in AVERAGE unless explicitly asked otherwise.
                         let say if the question ask about one month, calculate in daily/weekly average,
                         if the question ask about one week, calculate in daily average,
@@ -130,7 +196,7 @@ class LangChainRAG:
 
         system_message = prompt_template.format(
             dialect=self.db.dialect,
-            table_info=self.db.get_table_info(),
+            table_info=TABLE_INFO_PLACEHOLDER,
             top_k=50
         )
         
@@ -140,35 +206,196 @@ class LangChainRAG:
             "guess at the proper name - use this function to find similar ones."
         )
         
-        system = f"{system_message}\n\n{suffix}"
-        self.agent = create_react_agent(self.llm, self.tools, prompt=system, checkpointer=self.memory)
+        self.system_template = f"{system_message}\n\n{suffix}"
+        self.agent = create_react_agent(
+            self.llm,
+            self.tools,
+            prompt=self.build_prompt,
+            # Older tool outputs are shortened and the history kept within a token budget
+            pre_model_hook=make_history_hook(self.model_name),
+            checkpointer=self.memory
+        )
 
-    async def run_agent(self, question: str):
-        """Run the agent with streaming events"""
+    def build_prompt(self, state) -> list:
+        """System prompt describing only the tables relevant to the latest question"""
+        question = next((m.content for m in reversed(state["messages"]) if isinstance(m, HumanMessage)), "")
+        system = self.system_template.replace(TABLE_INFO_PLACEHOLDER, self.schema.describe(str(question)))
+        return [SystemMessage(content=system)] + state["messages"]
+
+    def schema_changed(self) -> bool:
+        """Whether the schema version moved since this agent was built"""
         try:
-            current_token = ""
-            async for msg, metadata in self.agent.astream(
-                {"messages": [HumanMessage(content=question)]},
-                config=self.config,
-                stream_mode='messages'
-            ):
-                if msg.content and metadata["langgraph_node"] == "agent":
-                    # yield json.dumps({"text": msg.content})  # print(msg.content, end="", flush=True)
-                
-                    for content in msg.content:
-                        current_token += content
-                        if current_token.endswith(" ") or any(current_token.endswith(p) for p in [".", ",", "!", "?", ":", ";"]):
-                            # Format the event as a proper SSE data event
-                            yield json.dumps({"text": current_token})
-                            current_token = ""
-            
-            # Send any remaining token
-            if current_token:
-                yield json.dumps({"text": current_token})
+            return get_schema_version(self.db._engine) != self.schema_version
+        except Exception as e:
+            logger.error(f"Error checking schema version: {str(e)}")
+            return False
+
+_shared_agent = None
+_shared_agent_lock = threading.Lock()
+
+def get_shared_agent(vector_store=None) -> SharedAgent:
+    """Return the process-wide agent, building it on first use.
+
+    Schema changes are handled by refresh_shared_agent() in the background,
+    so once built this only reads the current reference.
+    """
+    global _shared_agent
+    agent = _shared_agent
+    if agent is not None:
+        return agent
+    with _shared_agent_lock:
+        if _shared_agent is None:
+            _shared_agent = SharedAgent(vector_store=vector_store)
+        return _shared_agent
+
+def refresh_shared_agent():
+    """Rebuild the shared agent if the schema changed; run by the scheduler every SCHEMA_CHECK_INTERVAL seconds"""
+    global _shared_agent
+    previous = _shared_agent
+    if previous is None or not previous.schema_changed():
+        return
+    # Keep the checkpointer so existing conversations survive the rebuild
+    rebuilt = SharedAgent(vector_store=previous.vector_store, checkpointer=previous.memory)
+    # Swapped in with one assignment; turns already running finish on the previous agent
+    with _shared_agent_lock:
+        _shared_agent = rebuilt
+    previous.db._engine.dispose()
+
+class LangChainRAG:
+    def __init__(self, vector_store=None, thread_id=None):
+        """
+        Chat session on the shared agent graph
+        
+        Args:
+            vector_store: Pre-loaded vector store instance, used when the shared agent is first built
+            thread_id (str): Existing conversation to resume, a new one is created when omitted
+        """
+        self.shared = get_shared_agent(vector_store)
+        self.config = {"configurable": {"thread_id": thread_id or self.generate_thread_id()}}
+
+    @property
+    def agent(self):
+        return self.shared.agent
+
+    async def run_agent(self, question: str, telemetry: bool = False):
+        """Run the agent, yielding ready-to-send SSE frames of batched answer text.
+
+        Every turn is timed per stage; with telemetry the stream ends with a
+        {"telemetry": ...} frame summarizing it.
+        """
+        trace = TurnTrace()
+        try:
+            async for frame in self.answer_turn(question, trace):
+                yield frame
         except Exception as e:
-            error_msg = json.dumps({"error": str(e)})
-            yield error_msg
+            trace.outcome = "error"
+            yield sse_frame({"error": str(e)})
             logger.error(f"Error in run_agent: {str(e)}")
+        finally:
+            summary = trace.finish()
+        if telemetry:
+            yield sse_frame({"telemetry": summary})
+
+    async def answer_turn(self, question: str, trace: TurnTrace):
+        batcher = TokenBatcher()
+        answer = ""
+        self.shared = get_shared_agent()
+        answer_cache = get_answer_cache()
+
+        # Only the first question of a conversation stands on its own; follow-ups need the agent
+        first_turn = False
+        if INTENT_ROUTER_ENABLED or answer_cache is not None:
+            started = time.perf_counter()
+            first_turn = await self.is_first_turn()
+            trace.stage("threadState", started)
+
+        # Common question shapes are answered straight from SQL templates
+        if INTENT_ROUTER_ENABLED and first_turn:
+            started = time.perf_counter()
+            try:
+                routed = await asyncio.to_thread(intent_router.route, question, self.shared.db._engine)
+            except Exception as e:
+                logger.error(f"Intent router failed, using the agent: {str(e)}")
+                routed = None
+            trace.stage("intentRouter", started)
+            if routed is not None:
+                trace.mark_first_token()
+                async for frame in self.replay_answer(question, routed[1]):
+                    yield frame
+                trace.outcome = "intentRouter"
+                return
+
+        cache, vector, data_version = None, None, None
+        if answer_cache is not None and first_turn:
+            started = time.perf_counter()
+            try:
+                data_version = await answer_cache.current_data_version()
+                vector = await answer_cache.embed(question)
+                cache = answer_cache
+            except Exception as e:
+                logger.error(f"Answer cache unavailable: {str(e)}")
+
+            cached_answer = cache.lookup(vector) if cache is not None else None
+            trace.stage("answerCache", started)
+            if cached_answer is not None:
+                trace.mark_first_token()
+                async for frame in self.replay_answer(question, cached_answer):
+                    yield frame
+                trace.outcome = "answerCache"
+                return
+
+        async for msg, metadata in self.agent.astream(
+            {"messages": [HumanMessage(content=question)]},
+            # The trace times every node, tool and model call of this turn
+            config={**self.config, "callbacks": [trace]},
+            stream_mode='messages',
+            # Persist one checkpoint per turn instead of one per graph step
+            checkpoint_during=False
+        ):
+            if msg.content and metadata["langgraph_node"] == "agent":
+                trace.mark_first_token()
+                answer += msg.content
+                frame = batcher.add(msg.content)
+                if frame:
+                    yield frame
+            # Do not hold text back while the model finishes or tools run
+            if metadata["langgraph_node"] != "agent" or msg.response_metadata.get("finish_reason"):
+                frame = batcher.flush()
+                if frame:
+                    yield frame
+
+        # Send any remaining text
+        frame = batcher.flush()
+        if frame:
+            yield frame
+        trace.outcome = "agent"
+
+        if cache is not None and answer:
+            cache.store(vector, question, answer, data_version)
+
+    async def is_first_turn(self) -> bool:
+        """Whether the thread has no messages yet"""
+        try:
+            state = await self.agent.aget_state(self.config)
+        except Exception as e:
+            logger.error(f"Could not read the thread state: {str(e)}")
+            return False
+        return not state.values.get("messages")
+
+    async def start_thread(self):
+        """Write an empty checkpoint, so other workers can adopt the session before its first turn ends"""
+        await self.agent.aupdate_state(self.config, {"messages": []}, as_node="__start__")
+
+    async def replay_answer(self, question: str, answer: str):
+        """Stream an answer produced without the agent and record the turn in the thread"""
+        for start in range(0, len(answer), STREAM_FLUSH_CHARS):
+            yield sse_frame({"text": answer[start:start + STREAM_FLUSH_CHARS]})
+        # Follow-up questions keep their context
+        await self.agent.aupdate_state(
+            self.config,
+            {"messages": [HumanMessage(content=question), AIMessage(content=answer)]},
+            as_node="agent"
+        )
 
     # async def process_event(self, event):
     #     """Process streaming events from the agent"""
@@ -0,0 +1,197 @@
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, HumanMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from tools.embedding_cache import CachedEmbeddings, get_embedding_cache
+from typing import Any, Dict, List, Optional
+import numpy as np
+import asyncio
+import hashlib
+import json
+import re
+import os
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# "openai" talks to the API, "fake" runs fully offline for load tests and profiling
+CHAT_MODEL_PROVIDER = os.getenv("CHAT_MODEL_PROVIDER", "openai").lower()
+EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER", "openai").lower()
+
+# Scripted chat model settings
+FAKE_LLM_SCRIPT = os.getenv("FAKE_LLM_SCRIPT")
+FAKE_LLM_FIRST_TOKEN_MS = float(os.getenv("FAKE_LLM_FIRST_TOKEN_MS", "200"))
+FAKE_LLM_TOKEN_MS = float(os.getenv("FAKE_LLM_TOKEN_MS", "20"))
+
+# Hash embedding settings
+FAKE_EMBEDDING_DIMS = int(os.getenv("FAKE_EMBEDDING_DIMS", "256"))
+FAKE_EMBEDDING_LATENCY_MS = float(os.getenv("FAKE_EMBEDDING_LATENCY_MS", "0"))
+
+# Tool calls the fake agent makes before answering, skipped when the tool is not bound
+DEFAULT_FAKE_SCRIPT = [
+    {"tool": "sql_db_list_tables", "args": {"tool_input": ""}},
+    {"tool": "sql_db_query", "args": {"query": "SELECT brand, COUNT(*) AS products FROM product_catalog GROUP BY brand ORDER BY products DESC LIMIT 10"}}
+]
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+def split_tokens(text: str) -> List[str]:
+    return re.findall(r"\S+\s*|\s+", text)
+
+class ScriptedChatModel(BaseChatModel):
+    """Deterministic offline stand-in for ChatOpenAI.
+
+    After each human message it makes the script's tool calls one step at a
+    time, then streams an answer quoting the last tool result, sleeping
+    first_token_ms before the first chunk and token_ms between tokens.
+    """
+
+    script: List[Dict[str, Any]] = DEFAULT_FAKE_SCRIPT
+    first_token_ms: float = FAKE_LLM_FIRST_TOKEN_MS
+    token_ms: float = FAKE_LLM_TOKEN_MS
+    bound_tools: List[str] = []
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted-fake"
+
+    def bind_tools(self, tools, **kwargs):
+        names = [convert_to_openai_tool(tool)["function"]["name"] for tool in tools]
+        return self.model_copy(update={"bound_tools": names})
+
+    def next_message(self, messages: List[BaseMessage]) -> AIMessage:
+        step = 0
+        last_result = ""
+        for message in reversed(messages):
+            if isinstance(message, HumanMessage):
+                break
+            if isinstance(message, ToolMessage):
+                last_result = last_result or str(message.content)
+                step += 1
+
+        steps = [s for s in self.script if s["tool"] in self.bound_tools]
+        if step < len(steps):
+            return AIMessage(content="", tool_calls=[{
+                "name": steps[step]["tool"],
+                "args": steps[step].get("args", {}),
+                "id": f"call_{len(messages)}_{step}",
+                "type": "tool_call"
+            }])
+
+        answer = f"Berdasarkan data yang tersedia, berikut ringkasannya: {last_result[:300]}" if last_result else (
+            "Saya hanya dapat menjawab pertanyaan yang berkaitan dengan data penjualan, produk dan media sosial."
+        )
+        return AIMessage(content=answer)
+
+    def usage(self, messages: List[BaseMessage], output: str) -> Dict[str, int]:
+        input_tokens = sum(estimate_tokens(str(m.content)) for m in messages)
+        output_tokens = estimate_tokens(output)
+        return {"input_tokens": input_tokens, "output_tokens": output_tokens, "total_tokens": input_tokens + output_tokens}
+
+    def chunks(self, messages: List[BaseMessage]):
+        message = self.next_message(messages)
+        if message.tool_calls:
+            call = message.tool_calls[0]
+            yield ChatGenerationChunk(message=AIMessageChunk(
+                content="",
+                tool_call_chunks=[{"name": call["name"], "args": json.dumps(call["args"]), "id": call["id"], "index": 0}],
+                usage_metadata=self.usage(messages, json.dumps(call["args"])),
+                response_metadata={"finish_reason": "tool_calls"}
+            ))
+            return
+        tokens = split_tokens(message.content)
+        for i, token in enumerate(tokens):
+            last = i == len(tokens) - 1
+            yield ChatGenerationChunk(message=AIMessageChunk(
+                content=token,
+                usage_metadata=self.usage(messages, message.content) if last else None,
+                response_metadata={"finish_reason": "stop"} if last else {}
+            ))
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        message = self.next_message(messages)
+        message.usage_metadata = self.usage(messages, message.content or json.dumps([c["args"] for c in message.tool_calls]))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.first_token_ms / 1000)
+        for i, chunk in enumerate(self.chunks(messages)):
+            if i:
+                time.sleep(self.token_ms / 1000)
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self.first_token_ms / 1000)
+        for i, chunk in enumerate(self.chunks(messages)):
+            if i:
+                await asyncio.sleep(self.token_ms / 1000)
+            if run_manager:
+                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+class HashEmbeddings(Embeddings):
+    """Deterministic offline embeddings from hashed words and character trigrams.
+
+    Texts sharing words land close together, which is enough to exercise
+    retrieval and similarity thresholds without an embedding API.
+    """
+
+    def __init__(self, dims: int = FAKE_EMBEDDING_DIMS, latency_ms: float = FAKE_EMBEDDING_LATENCY_MS):
+        self.dims = dims
+        self.latency_ms = latency_ms
+
+    def embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.dims, dtype=np.float32)
+        for word in re.findall(r"\w+", text.lower()):
+            padded = f"#{word}#"
+            features = [word] + [padded[i:i + 3] for i in range(len(padded) - 2)]
+            for j, feature in enumerate(features):
+                digest = int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest(), "little")
+                # Whole words weigh more than their trigrams
+                weight = 2.0 if j == 0 else 1.0
+                vector[digest % self.dims] += weight if (digest >> 63) & 1 else -weight
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        return [self.embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms / 1000)
+        return [self.embed(text) for text in texts]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+def get_chat_model(model_name: str = "gpt-4o", temperature: float = 0, streaming: bool = True) -> BaseChatModel:
+    """Chat model of the configured provider"""
+    if CHAT_MODEL_PROVIDER == "fake":
+        script = json.loads(FAKE_LLM_SCRIPT) if FAKE_LLM_SCRIPT else DEFAULT_FAKE_SCRIPT
+        return ScriptedChatModel(script=script)
+    from langchain_openai import ChatOpenAI
+    # stream_usage reports token usage on streamed responses too
+    return ChatOpenAI(model=model_name, temperature=temperature, streaming=streaming, stream_usage=True, verbose=False)
+
+def get_embeddings(model: str = "text-embedding-3-large") -> Embeddings:
+    """Embedding model of the configured provider, behind the on-disk cache when enabled"""
+    if EMBEDDING_PROVIDER == "fake":
+        embeddings = HashEmbeddings()
+    else:
+        from langchain_openai import OpenAIEmbeddings
+        embeddings = OpenAIEmbeddings(model=model)
+    cache = get_embedding_cache()
+    if cache is None:
+        return embeddings
+    # The provider is part of the key so offline vectors never stand in for real ones
+    return CachedEmbeddings(embeddings, f"{EMBEDDING_PROVIDER}:{model}", cache)
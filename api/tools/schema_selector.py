@@ -0,0 +1,104 @@
+from langchain_community.utilities import SQLDatabase
+from db.analytic_views import ANALYTIC_VIEWS
+from typing import Dict, List, Set
+import re
+import os
+
+# Most tables described in the prompt of one turn, besides the join tables they need
+SCHEMA_MAX_TABLES = int(os.getenv("SCHEMA_MAX_TABLES", "4"))
+# Described in every turn: brands and products are the dimension nearly every question filters on
+SCHEMA_ALWAYS_TABLES = [name for name in os.getenv("SCHEMA_ALWAYS_TABLES", "product_catalog").split(",") if name]
+
+# What each table holds, in the words users ask with (Indonesian and English)
+TABLE_NOTES = {
+    "product_catalog": "shoe products with brand, subcategory, price, rating and units sold (terjual)",
+    "reviewed_product": "customer product reviews; sentiment_score 0-1, >= 0.5 is positive",
+    "customer_demographics": "customers with age_group, gender and location",
+    "campaign": "marketing campaigns with budget, reach, dates and platform",
+    "sentiment_campaign": "sentiment of campaign reviews",
+    "social_media": "brand social media posts with platform, reach_count, engagement_count and collaborators",
+    "sentiment_social_media": "comments on social media posts; sentiment_score 0-1, >= 0.5 is positive",
+    "sales": "sales transactions with purchase_date and order_value in rupiah",
+    "sale_product": "products of each sales transaction",
+    "sustainability_integration": "eco-friendly keyword usage and sustainability sentiment"
+}
+
+TABLE_KEYWORDS = {
+    "product_catalog": {"produk", "product", "products", "sepatu", "shoe", "shoes", "brand", "merek", "kategori", "category", "harga", "price", "rating", "terjual", "terlaris", "stok"},
+    "reviewed_product": {"ulasan", "review", "reviews", "sentimen", "sentiment", "rating", "komplain", "keluhan", "aspek", "aspect"},
+    "customer_demographics": {"pelanggan", "customer", "customers", "konsumen", "umur", "usia", "age", "gender", "lokasi", "location", "kota", "city", "demografi", "demographic", "demographics"},
+    "campaign": {"kampanye", "campaign", "campaigns", "budget", "anggaran", "promosi", "iklan"},
+    "sentiment_campaign": {"kampanye", "campaign", "sentimen", "sentiment"},
+    "social_media": {"media", "sosial", "social", "post", "posting", "postingan", "instagram", "tiktok", "twitter", "facebook", "engagement", "reach", "jangkauan", "kolaborasi", "collab", "collabs", "influencer", "konten", "content", "hashtag"},
+    "sentiment_social_media": {"komentar", "comment", "comments", "sentimen", "sentiment", "likes", "replies"},
+    "sales": {"penjualan", "penjualanku", "sales", "transaksi", "transaction", "omzet", "omset", "pendapatan", "revenue", "order", "pembayaran", "payment", "return", "retur"},
+    "sale_product": {"terlaris", "terjual", "best", "selling"},
+    "sustainability_integration": {"sustainability", "keberlanjutan", "eco", "ramah", "lingkungan"},
+    "brand_daily_sales": {"penjualan", "penjualanku", "sales", "transaksi", "transaction", "omzet", "omset", "pendapatan", "revenue", "order", "retur", "return", "harian", "daily", "bulanan", "monthly", "tren", "trend"},
+    "product_daily_sales": {"produk", "product", "products", "sepatu", "shoe", "shoes", "terlaris", "terjual", "best", "selling", "unit", "units"},
+    "brand_daily_reviews": {"ulasan", "review", "reviews", "sentimen", "sentiment", "rating", "positif", "positive", "negatif", "negative"},
+    "platform_daily_social": {"media", "sosial", "social", "platform", "instagram", "tiktok", "twitter", "facebook", "engagement", "reach", "jangkauan", "post", "posting", "postingan", "komentar", "comment", "comments"}
+}
+
+def tokenize(text: str) -> Set[str]:
+    return set(re.findall(r"[a-z0-9]+", text.lower()))
+
+class SchemaSelector:
+    """Compact per-table descriptions, and the subset relevant to a question.
+
+    Descriptions come from the reflected metadata of the agent's SQLDatabase,
+    so they are rebuilt along with the shared agent when the schema changes.
+    """
+
+    def __init__(self, db: SQLDatabase, max_tables: int = SCHEMA_MAX_TABLES):
+        self.max_tables = max_tables
+        self.tables = [name for name in db.get_usable_table_names()]
+        self.descriptions: Dict[str, str] = {}
+        self.terms: Dict[str, Set[str]] = {}
+        self.neighbors: Dict[str, Set[str]] = {name: set() for name in self.tables}
+
+        for name in self.tables:
+            table = db._metadata.tables[name]
+            columns = []
+            for column in table.columns:
+                entry = f"{column.name} {str(column.type).lower()}"
+                if column.primary_key:
+                    entry += " pk"
+                for fk in column.foreign_keys:
+                    entry += f" -> {fk.target_fullname}"
+                    target = fk.column.table.name
+                    if target in self.neighbors:
+                        self.neighbors[name].add(target)
+                        self.neighbors[target].add(name)
+                columns.append(entry)
+            note = TABLE_NOTES.get(name) or (f"daily view: {ANALYTIC_VIEWS[name].description}" if name in ANALYTIC_VIEWS else None)
+            self.descriptions[name] = f"{name}({', '.join(columns)})" + (f" -- {note}" if note else "")
+            self.terms[name] = (
+                TABLE_KEYWORDS.get(name, set())
+                | tokenize(name.replace("_", " "))
+                | {column.name.lower() for column in table.columns}
+            )
+
+    def select(self, question: str) -> List[str]:
+        """Tables matching the question, plus the join tables linking them"""
+        words = tokenize(question)
+        scores = {name: len(words & terms) for name, terms in self.terms.items()}
+        # On equal scores the small analytic views come before the raw tables
+        ranked = [name for name in sorted(self.tables, key=lambda n: (-scores[n], n not in ANALYTIC_VIEWS)) if scores[name] > 0]
+        if not ranked:
+            return list(self.tables)
+        selected = ranked[:self.max_tables]
+        selected += [name for name in SCHEMA_ALWAYS_TABLES if name in self.neighbors and name not in selected]
+        # Bridge tables such as sale_product connect two selected tables
+        for name in self.tables:
+            if name not in selected and len(self.neighbors[name] & set(selected)) >= 2:
+                selected.append(name)
+        return selected
+
+    def describe(self, question: str) -> str:
+        selected = self.select(question)
+        lines = [self.descriptions[name] for name in selected]
+        others = [name for name in self.tables if name not in selected]
+        if others:
+            lines.append(f"Other tables (use sql_db_schema to see their columns): {', '.join(others)}")
+        return "\n".join(lines)
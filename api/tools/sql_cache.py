@@ -0,0 +1,118 @@
+from langchain_community.tools.sql_database.tool import QuerySQLDatabaseTool
+from langchain_core.callbacks import CallbackManagerForToolRun
+from collections import OrderedDict
+from db.rollups import get_data_version
+from tools.sql_guard import run_guarded_query
+from typing import Any, Dict, Optional
+import threading
+import re
+import os
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+SQL_CACHE_ENABLED = os.getenv("SQL_CACHE_ENABLED", "true").lower() == "true"
+SQL_CACHE_TTL = int(os.getenv("SQL_CACHE_TTL", "3600"))
+SQL_CACHE_MAX_ENTRIES = int(os.getenv("SQL_CACHE_MAX_ENTRIES", "2000"))
+
+# String literals and quoted identifiers keep their case and spacing
+QUOTED = re.compile(r"""('(?:''|[^'])*'|"(?:""|[^"])*")""")
+COMMENTS = re.compile(r"--[^\n]*|/\*.*?\*/", re.DOTALL)
+
+def normalize_sql(query: str) -> str:
+    """Canonical text of a query: no comments, collapsed whitespace, lowercase keywords"""
+    parts = QUOTED.split(query.strip())
+    for i in range(0, len(parts), 2):
+        part = COMMENTS.sub(" ", parts[i])
+        part = re.sub(r"\s+", " ", part).lower()
+        # No space around punctuation, so "a , b" and "a,b" are the same query
+        parts[i] = re.sub(r"\s*([(),=<>;])\s*", r"\1", part)
+    return "".join(parts).strip().rstrip(";").strip()
+
+class SQLResultCache:
+    """TTL-bounded LRU of agent query results, dropped when the data version changes"""
+
+    def __init__(self, ttl: int = SQL_CACHE_TTL, max_entries: int = SQL_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.data_version: Optional[str] = None
+        self.hits = 0
+        self.misses = 0
+        # Tools run in executor threads
+        self.lock = threading.Lock()
+
+    def check_version(self) -> str:
+        version = get_data_version()
+        with self.lock:
+            if version != self.data_version:
+                self.entries.clear()
+                self.data_version = version
+        return version
+
+    def get(self, key: str) -> Optional[str]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and time.time() - entry[1] <= self.ttl:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+            return None
+
+    def store(self, key: str, result: str, data_version: str) -> None:
+        with self.lock:
+            if data_version != self.data_version:
+                return
+            self.entries[key] = (result, time.time())
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": SQL_CACHE_ENABLED,
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+sql_result_cache = SQLResultCache()
+
+class CachedQuerySQLDatabaseTool(QuerySQLDatabaseTool):
+    """sql_db_query with guardrails that answers repeated SELECTs from the result cache"""
+
+    def _run(
+        self,
+        query: str,
+        run_manager: Optional[CallbackManagerForToolRun] = None,
+    ):
+        key = normalize_sql(query)
+        if not SQL_CACHE_ENABLED or not key.startswith(("select", "with")):
+            return run_guarded_query(self.db, query)
+
+        try:
+            data_version = sql_result_cache.check_version()
+        except Exception as e:
+            logger.error(f"SQL cache unavailable: {str(e)}")
+            return run_guarded_query(self.db, query)
+
+        result = sql_result_cache.get(key)
+        if result is not None:
+            return result
+        result = run_guarded_query(self.db, query)
+        # Errors are rewritten by the agent, never worth replaying
+        if isinstance(result, str) and not result.startswith("Error:"):
+            sql_result_cache.store(key, result, data_version)
+        return result
+
+def with_cached_query_tool(tools):
+    """Swap the toolkit's query tool for the cached one, keeping its name and description"""
+    return [
+        CachedQuerySQLDatabaseTool(db=tool.db, description=tool.description)
+        if type(tool) is QuerySQLDatabaseTool else tool
+        for tool in tools
+    ]
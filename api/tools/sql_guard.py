@@ -0,0 +1,228 @@
+from langchain_community.utilities import SQLDatabase
+from langchain_community.utilities.sql_database import truncate_word
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.exc import SQLAlchemyError
+from db.database import DATABASE_URL
+from db.analytic_views import ANALYTIC_VIEWS
+from typing import Any, Dict
+import re
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+# The agent gets its own small pool so chat load cannot starve the dashboards
+AGENT_DB_POOL_SIZE = int(os.getenv("AGENT_DB_POOL_SIZE", "3"))
+AGENT_DB_MAX_OVERFLOW = int(os.getenv("AGENT_DB_MAX_OVERFLOW", "0"))
+AGENT_DB_POOL_TIMEOUT = int(os.getenv("AGENT_DB_POOL_TIMEOUT", "10"))
+
+# Application bookkeeping the agent must never see: other users' chat history and rollup state
+AGENT_HIDDEN_TABLES = [
+    "checkpoints", "checkpoint_blobs", "checkpoint_writes", "checkpoint_migrations", "writes",
+    "rollup_watermark", "rollup_dirty_day"
+]
+# Early, friendlier rejection only; the agent role's privileges are what keep these tables out of reach
+HIDDEN_TABLE_PATTERN = re.compile(
+    rf"\b(?:from|join)\s+(?:\w+\.)?\"?({'|'.join(AGENT_HIDDEN_TABLES)})\b", re.IGNORECASE
+)
+
+# Role every agent query runs as: SELECT on the public schema except the hidden tables.
+# Created on startup, which needs CREATEROLE; when it cannot be used, or is empty, agent
+# queries run as the API user and only the table-name check hides the tables
+AGENT_DB_ROLE = os.getenv("AGENT_DB_ROLE", "chat_agent_reader")
+
+# Guardrails applied to every query the agent writes
+AGENT_STATEMENT_TIMEOUT_MS = int(os.getenv("AGENT_STATEMENT_TIMEOUT_MS", "15000"))
+AGENT_MAX_QUERY_COST = float(os.getenv("AGENT_MAX_QUERY_COST", "1000000"))
+AGENT_MAX_ROWS = int(os.getenv("AGENT_MAX_ROWS", "200"))
+
+# SQLSTATE of a statement cancelled by statement_timeout
+QUERY_CANCELED = "57014"
+
+guard_stats = {"executed": 0, "rejected": 0, "timedOut": 0, "truncated": 0, "queryRole": None}
+
+def create_agent_database() -> SQLDatabase:
+    engine = create_engine(
+        DATABASE_URL,
+        pool_size=AGENT_DB_POOL_SIZE,
+        max_overflow=AGENT_DB_MAX_OVERFLOW,
+        pool_timeout=AGENT_DB_POOL_TIMEOUT,
+        pool_pre_ping=True
+    )
+    query_role = None
+    if AGENT_DB_ROLE:
+        try:
+            ensure_agent_role(engine)
+        except SQLAlchemyError as e:
+            logger.error(f"Failed to set up agent role {AGENT_DB_ROLE}: {str(e)}")
+        # It may still have been set up by an administrator
+        query_role = AGENT_DB_ROLE if can_set_role(engine, AGENT_DB_ROLE) else None
+        if query_role is None:
+            logger.error(
+                f"Agent role {AGENT_DB_ROLE} is not usable, agent queries run as the API user and can "
+                f"read the hidden tables through the database; grant the role or set AGENT_DB_ROLE"
+            )
+    inspector = inspect(engine)
+    # SQLDatabase rejects ignore_tables entries that do not exist
+    existing = set(inspector.get_table_names())
+    views = set(inspector.get_view_names()) & set(ANALYTIC_VIEWS)
+    database = SQLDatabase(
+        engine,
+        ignore_tables=[name for name in AGENT_HIDDEN_TABLES if name in existing],
+        view_support=True,
+        # Shown by the schema tool instead of the reflected CREATE TABLE and sample rows
+        custom_table_info={name: analytic_view_info(name, inspector.get_columns(name)) for name in views}
+    )
+    # Read by run_guarded_query; None when agent queries run as the API user
+    database.query_role = query_role
+    guard_stats["queryRole"] = query_role
+    return database
+
+def can_set_role(engine, role: str) -> bool:
+    """Whether this connection's user can switch to the role, tried in a rolled back transaction"""
+    try:
+        with engine.connect() as connection:
+            with connection.begin() as transaction:
+                connection.exec_driver_sql(f'SET LOCAL ROLE "{role}"')
+                transaction.rollback()
+        return True
+    except SQLAlchemyError as e:
+        logger.error(f"Cannot switch to agent role {role}: {str(e)}")
+        return False
+
+def ensure_agent_role(engine):
+    """Create the agent role and grant it the public tables, minus the hidden ones.
+
+    Run on every agent build so tables created since are granted too.
+    """
+    with engine.begin() as connection:
+        exists = connection.execute(text("SELECT 1 FROM pg_roles WHERE rolname = :role"), {"role": AGENT_DB_ROLE}).scalar()
+        if not exists:
+            connection.exec_driver_sql(f'CREATE ROLE "{AGENT_DB_ROLE}" NOLOGIN')
+        connection.exec_driver_sql(f'GRANT "{AGENT_DB_ROLE}" TO CURRENT_USER')
+        connection.exec_driver_sql(f'GRANT USAGE ON SCHEMA public TO "{AGENT_DB_ROLE}"')
+        connection.exec_driver_sql(f'GRANT SELECT ON ALL TABLES IN SCHEMA public TO "{AGENT_DB_ROLE}"')
+        existing = set(inspect(connection).get_table_names())
+        for name in AGENT_HIDDEN_TABLES:
+            if name in existing:
+                connection.exec_driver_sql(f'REVOKE ALL ON public."{name}" FROM "{AGENT_DB_ROLE}"')
+
+def analytic_view_info(name: str, columns) -> str:
+    column_list = ",\n\t".join(f"{column['name']} {str(column['type'])}" for column in columns)
+    return (
+        f"CREATE VIEW {name} (\n\t{column_list}\n)\n\n"
+        f"/*\nRead-only daily aggregate, one row per {', '.join(ANALYTIC_VIEWS[name].key)}: "
+        f"{ANALYTIC_VIEWS[name].description}.\nPrefer it over joining the raw tables.\n*/"
+    )
+
+DOLLAR_QUOTE_PATTERN = re.compile(r"\$[A-Za-z_]*\$")
+
+def statement_separators(query: str):
+    """Positions of the semicolons outside string literals, quoted identifiers and comments"""
+    i = 0
+    while i < len(query):
+        char = query[i]
+        if char in "'\"":
+            # A doubled quote inside the literal closes and reopens it, which is the same thing
+            end = query.find(char, i + 1)
+            i = len(query) if end == -1 else end + 1
+            continue
+        if query.startswith("--", i):
+            end = query.find("\n", i)
+            i = len(query) if end == -1 else end + 1
+            continue
+        if query.startswith("/*", i):
+            end = query.find("*/", i + 2)
+            i = len(query) if end == -1 else end + 2
+            continue
+        dollar = DOLLAR_QUOTE_PATTERN.match(query, i) if char == "$" else None
+        if dollar:
+            end = query.find(dollar.group(), dollar.end())
+            i = len(query) if end == -1 else end + len(dollar.group())
+            continue
+        if char == ";":
+            yield i
+        i += 1
+
+def is_blank(sql: str) -> bool:
+    """Whether a piece of SQL holds nothing but whitespace, comments and semicolons"""
+    sql = re.sub(r"--[^\n]*|/\*.*?\*/", "", sql, flags=re.DOTALL)
+    return not sql.replace(";", "").strip()
+
+def has_second_statement(query: str) -> bool:
+    return any(not is_blank(query[position + 1:]) for position in statement_separators(query))
+
+def strip_trailing_semicolons(query: str) -> str:
+    """The query up to its first separator, which only trailing comments or semicolons follow"""
+    for position in statement_separators(query):
+        return query[:position].strip()
+    return query
+
+def run_guarded_query(db: SQLDatabase, query: str) -> str:
+    """Run an agent query read-only, after an EXPLAIN cost check, with a timeout and row cap.
+
+    Returns the rows formatted like SQLDatabase.run, or an "Error: ..."
+    message the agent can act on.
+    """
+    query = query.strip()
+    if has_second_statement(query):
+        guard_stats["rejected"] += 1
+        return "Error: run a single SELECT statement at a time."
+    query = strip_trailing_semicolons(query)
+    if HIDDEN_TABLE_PATTERN.search(query):
+        guard_stats["rejected"] += 1
+        return "Error: that table is not available. Only query the tables described in the prompt."
+    try:
+        with db._engine.connect() as connection, connection.begin():
+            connection.exec_driver_sql("SET TRANSACTION READ ONLY")
+            role = getattr(db, "query_role", None)
+            if role:
+                # Privileges, not the query text, decide which tables are readable
+                connection.exec_driver_sql(f'SET LOCAL ROLE "{role}"')
+            connection.exec_driver_sql(f"SET LOCAL statement_timeout = {AGENT_STATEMENT_TIMEOUT_MS}")
+
+            plan = connection.execute(text(f"EXPLAIN (FORMAT JSON) {query}")).scalar()
+            cost = plan[0]["Plan"]["Total Cost"]
+            if cost > AGENT_MAX_QUERY_COST:
+                guard_stats["rejected"] += 1
+                logger.warning(f"Rejected agent query with estimated cost {cost:.0f}: {query}")
+                return (
+                    f"Error: the query was not run because its estimated cost ({cost:.0f}) is above "
+                    f"the limit ({AGENT_MAX_QUERY_COST:.0f}). Filter on dates or brand, aggregate, "
+                    f"or avoid joins that multiply rows, then try again."
+                )
+
+            # Server-side cursor, so at most AGENT_MAX_ROWS rows ever leave Postgres
+            result = connection.execution_options(stream_results=True, max_row_buffer=AGENT_MAX_ROWS + 1).execute(text(query))
+            if not result.returns_rows:
+                return ""
+            rows = result.fetchmany(AGENT_MAX_ROWS + 1)
+            result.close()
+        guard_stats["executed"] += 1
+    except SQLAlchemyError as e:
+        if getattr(getattr(e, "orig", None), "pgcode", None) == QUERY_CANCELED:
+            guard_stats["timedOut"] += 1
+            return (
+                f"Error: the query was cancelled after {AGENT_STATEMENT_TIMEOUT_MS} ms. "
+                f"Make it cheaper with tighter filters or aggregation and try again."
+            )
+        return f"Error: {e}"
+
+    truncated = len(rows) > AGENT_MAX_ROWS
+    formatted = str([
+        tuple(truncate_word(value, length=db._max_string_length) for value in row)
+        for row in rows[:AGENT_MAX_ROWS]
+    ]) if rows else ""
+    if truncated:
+        guard_stats["truncated"] += 1
+        formatted += f"\n(Only the first {AGENT_MAX_ROWS} rows are shown; aggregate or add a LIMIT.)"
+    return formatted
+
+def guard_stats_snapshot() -> Dict[str, Any]:
+    return {
+        **guard_stats,
+        "maxQueryCost": AGENT_MAX_QUERY_COST,
+        "statementTimeoutMs": AGENT_STATEMENT_TIMEOUT_MS,
+        "maxRows": AGENT_MAX_ROWS,
+        "poolSize": AGENT_DB_POOL_SIZE
+    }
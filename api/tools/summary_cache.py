@@ -0,0 +1,126 @@
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict
+import asyncio
+import hashlib
+import json
+import os
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_CACHE_TTL = int(os.getenv("SUMMARY_CACHE_TTL", "3600"))
+# Stale entries younger than this may be served while a refresh runs in the background
+SUMMARY_CACHE_STALE_TTL = int(os.getenv("SUMMARY_CACHE_STALE_TTL", "86400"))
+SUMMARY_CACHE_SERVE_STALE = os.getenv("SUMMARY_CACHE_SERVE_STALE", "true").lower() == "true"
+SUMMARY_CACHE_MAX_ENTRIES = int(os.getenv("SUMMARY_CACHE_MAX_ENTRIES", "1000"))
+
+def summary_cache_key(dashboard_data: Dict[str, Any], brand: str, model: str) -> str:
+    """Hash of the canonical JSON of the dashboard data plus brand and model"""
+    canonical = json.dumps(
+        {"data": dashboard_data, "brand": brand, "model": model},
+        sort_keys=True, separators=(",", ":"), default=str
+    )
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+class CacheEntry:
+    def __init__(self, result: Dict[str, Any], tokens: int):
+        self.result = result
+        self.tokens = tokens
+        self.created_at = time.time()
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.created_at
+
+class SummaryCache:
+    """Content-addressed LRU cache of dashboard summaries.
+
+    Concurrent misses for the same key share one generation, and stale
+    entries can be served while a single background refresh replaces them.
+    """
+
+    def __init__(
+        self,
+        ttl: int = SUMMARY_CACHE_TTL,
+        stale_ttl: int = SUMMARY_CACHE_STALE_TTL,
+        max_entries: int = SUMMARY_CACHE_MAX_ENTRIES
+    ):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self.pending: Dict[str, asyncio.Task] = {}
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.tokens_saved = 0
+
+    def store(self, key: str, result: Dict[str, Any], tokens: int) -> None:
+        self.entries[key] = CacheEntry(result, tokens)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def refresh(self, key: str, generate: Callable[[], Awaitable[Dict[str, Any]]]) -> asyncio.Task:
+        """Start generating the summary for key, or join the generation already running"""
+        task = self.pending.get(key)
+        if task is None:
+            async def run():
+                try:
+                    result = await generate()
+                    if result.get("status") == "success":
+                        self.store(key, result, result.get("usage", {}).get("total_tokens", 0))
+                    else:
+                        logger.warning(f"Summary generation failed, not cached: {result.get('message')}")
+                    return result
+                finally:
+                    self.pending.pop(key, None)
+            task = asyncio.create_task(run())
+            self.pending[key] = task
+        return task
+
+    def lookup(self, key: str):
+        """Fresh cached result for key, counted as a hit, or None counted as a miss"""
+        entry = self.entries.get(key)
+        if entry is None or entry.age > self.ttl:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.tokens_saved += entry.tokens
+        self.entries.move_to_end(key)
+        return entry.result
+
+    async def get_or_generate(
+        self,
+        key: str,
+        generate: Callable[[], Awaitable[Dict[str, Any]]],
+        serve_stale: bool = SUMMARY_CACHE_SERVE_STALE
+    ) -> Dict[str, Any]:
+        entry = self.entries.get(key)
+        if entry is not None and entry.age <= self.ttl:
+            self.hits += 1
+            self.tokens_saved += entry.tokens
+            self.entries.move_to_end(key)
+            return {**entry.result, "cached": True}
+
+        if entry is not None and serve_stale and entry.age <= self.stale_ttl:
+            self.stale_hits += 1
+            self.tokens_saved += entry.tokens
+            self.refresh(key, generate)
+            return {**entry.result, "cached": True, "stale": True}
+
+        self.misses += 1
+        result = await asyncio.shield(self.refresh(key, generate))
+        return {**result, "cached": False}
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "staleHits": self.stale_hits,
+            "misses": self.misses,
+            "hitRate": round((self.hits + self.stale_hits) / lookups, 4) if lookups else 0.0,
+            "tokensSaved": self.tokens_saved
+        }
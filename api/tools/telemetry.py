@@ -0,0 +1,200 @@
+from langchain_core.callbacks import BaseCallbackHandler
+from bisect import bisect_left
+from typing import Any, Dict, List, Optional, Tuple
+from uuid import UUID
+import threading
+import time
+import os
+
+# Whether chat responses end with a telemetry event unless the request says otherwise
+CHAT_TELEMETRY_TRAILER = os.getenv("CHAT_TELEMETRY_TRAILER", "false").lower() == "true"
+
+LATENCY_BUCKETS_MS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000]
+TOKEN_BUCKETS = [100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000]
+ROW_BUCKETS = [0, 1, 5, 10, 50, 100, 200, 1000]
+
+def count_result_rows(content: str) -> int:
+    """Rows in a sql_db_query result, which is formatted as a list of tuples"""
+    return content.count("), (") + 1 if content.startswith("[(") else 0
+
+class Histogram:
+    """Fixed-bucket histogram; quantiles are estimated as the upper bound of their bucket"""
+
+    def __init__(self, buckets: List[float]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self.count:
+            return None
+        seen = 0
+        for bound, count in zip(self.buckets + [float("inf")], self.counts):
+            seen += count
+            if seen >= q * self.count:
+                return bound if bound != float("inf") else self.buckets[-1]
+        return self.buckets[-1]
+
+    def snapshot(self) -> Dict[str, Any]:
+        cumulative = 0
+        buckets = []
+        for bound, count in zip(self.buckets + ["+Inf"], self.counts):
+            cumulative += count
+            buckets.append([bound, cumulative])
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 2),
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "buckets": buckets
+        }
+
+class ChatTelemetry:
+    """Process-wide histograms of chat turns, keyed by stage"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latency: Dict[str, Histogram] = {}
+        self.tokens_in = Histogram(TOKEN_BUCKETS)
+        self.tokens_out = Histogram(TOKEN_BUCKETS)
+        self.sql_rows = Histogram(ROW_BUCKETS)
+        self.outcomes: Dict[str, int] = {}
+
+    def observe_latency(self, stage: str, ms: float):
+        with self.lock:
+            if stage not in self.latency:
+                self.latency[stage] = Histogram(LATENCY_BUCKETS_MS)
+            self.latency[stage].observe(ms)
+
+    def record_turn(self, summary: Dict[str, Any]):
+        self.observe_latency("turn", summary["totalMs"])
+        if summary["firstTokenMs"] is not None:
+            self.observe_latency("firstToken", summary["firstTokenMs"])
+        with self.lock:
+            self.tokens_in.observe(summary["tokensIn"])
+            self.tokens_out.observe(summary["tokensOut"])
+            self.sql_rows.observe(summary["sqlRows"])
+            self.outcomes[summary["outcome"]] = self.outcomes.get(summary["outcome"], 0) + 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "turns": dict(self.outcomes),
+                "latencyMs": {stage: histogram.snapshot() for stage, histogram in sorted(self.latency.items())},
+                "tokensIn": self.tokens_in.snapshot(),
+                "tokensOut": self.tokens_out.snapshot(),
+                "sqlRowsPerTurn": self.sql_rows.snapshot()
+            }
+
+chat_telemetry = ChatTelemetry()
+
+class TurnTrace(BaseCallbackHandler):
+    """Callback handler timing one chat turn.
+
+    Records every LangGraph node, tool call and model call of the turn, the
+    token usage the model reports and the rows returned by sql_db_query.
+    Stages run outside the graph (intent router, answer cache) are added
+    with stage().
+    """
+
+    # Bookkeeping only, so run in the caller instead of an executor
+    run_inline = True
+
+    def __init__(self, telemetry: ChatTelemetry = chat_telemetry):
+        self.telemetry = telemetry
+        self.started = time.perf_counter()
+        # Set by the pipeline once the turn completes; a turn left as is was abandoned
+        self.outcome = "cancelled"
+        self.first_token_at: Optional[float] = None
+        self.running: Dict[UUID, Tuple[str, float]] = {}
+        self.stages: Dict[str, Dict[str, float]] = {}
+        self.tokens_in = 0
+        self.tokens_out = 0
+        self.sql_queries = 0
+        self.sql_rows = 0
+
+    def record(self, stage: str, ms: float):
+        totals = self.stages.setdefault(stage, {"calls": 0, "ms": 0.0})
+        totals["calls"] += 1
+        totals["ms"] += ms
+        self.telemetry.observe_latency(stage, ms)
+
+    def stage(self, stage: str, started: float):
+        """Record a stage that started at the given perf_counter() time"""
+        self.record(stage, (time.perf_counter() - started) * 1000)
+
+    def start(self, run_id: UUID, stage: str):
+        self.running[run_id] = (stage, time.perf_counter())
+
+    def end(self, run_id: UUID) -> Optional[str]:
+        stage, started = self.running.pop(run_id, (None, None))
+        if stage is not None:
+            self.stage(stage, started)
+        return stage
+
+    def mark_first_token(self):
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+
+    def on_chain_start(self, serialized, inputs, *, run_id, tags=None, metadata=None, **kwargs):
+        # Graph nodes run as chains named after the node and tagged with their step
+        name = kwargs.get("name")
+        if name and name == (metadata or {}).get("langgraph_node") and any(tag.startswith("graph:step:") for tag in tags or []):
+            self.start(run_id, f"node:{name}")
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self.end(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self.end(run_id)
+
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        self.start(run_id, f"tool:{(serialized or {}).get('name') or kwargs.get('name') or 'tool'}")
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        if self.end(run_id) == "tool:sql_db_query":
+            content = getattr(output, "content", output)
+            self.sql_queries += 1
+            self.sql_rows += count_result_rows(content if isinstance(content, str) else str(content))
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self.end(run_id)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self.start(run_id, "model")
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        self.end(run_id)
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if usage:
+                    self.tokens_in += usage.get("input_tokens", 0)
+                    self.tokens_out += usage.get("output_tokens", 0)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self.end(run_id)
+
+    def finish(self) -> Dict[str, Any]:
+        """Record the turn in the process-wide histograms and return its summary"""
+        summary = {
+            "outcome": self.outcome,
+            "totalMs": round((time.perf_counter() - self.started) * 1000, 1),
+            "firstTokenMs": round((self.first_token_at - self.started) * 1000, 1) if self.first_token_at else None,
+            "tokensIn": self.tokens_in,
+            "tokensOut": self.tokens_out,
+            "sqlQueries": self.sql_queries,
+            "sqlRows": self.sql_rows,
+            "stages": {
+                stage: {"calls": int(totals["calls"]), "ms": round(totals["ms"], 1)}
+                for stage, totals in self.stages.items()
+            }
+        }
+        self.telemetry.record_turn(summary)
+        return summary
@@ -165,8 +165,7 @@ const SocialMediaDashboard = () => {
           timeSeriesResult,
           contentData,
           platformData,
-          postsReachData,
-          postsEngagementData,
+          topPostsData,
           hashtagsData,
           collaboratorsData
         ] = await Promise.all([
@@ -174,8 +173,7 @@ const SocialMediaDashboard = () => {
           fetchDataFromEndpoint("timeseries"),
           fetchDataFromEndpoint("content-performance"),
           fetchDataFromEndpoint("platform-performance"),
-          fetchDataFromEndpoint("top-posts/reach"),
-          fetchDataFromEndpoint("top-posts/engagement"),
+          fetchDataFromEndpoint("top-posts"),
           fetchDataFromEndpoint("top-hashtags"),
           fetchDataFromEndpoint("top-collaborators")
         ]);
@@ -253,8 +251,8 @@ const SocialMediaDashboard = () => {
             }
           ]
         });
-        setTopPostsByReach(postsReachData);
-        setTopPostsByEngagement(postsEngagementData);
+        setTopPostsByReach(topPostsData.byReach);
+        setTopPostsByEngagement(topPostsData.byEngagement);
         setTopHashtags(hashtagsData);
         setTopCollaborators(collaboratorsData);
 